@@ -0,0 +1,148 @@
+# -> compares the old python-loop aggregation against the current read paths in crud: the balance, analytics
+# -> and member summary totals come from the ledger snapshot plus its tail, the analytics timeline from the
+# -> daily rollups, so none of them reads the expense or split rows.
+# -> run from the project root: python -m benchmarks.bench_aggregation --expenses 100000
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from uuid import uuid4
+from sqlalchemy import delete, insert
+import crud
+import ledger
+import models
+from database import SessionLocal
+
+
+# this seeds one group with the given number of expenses, every expense split equally among all members
+def seed_group(db, expenses: int, members: int):
+    group = models.Group(id=uuid4(), name="bench group", description="aggregation benchmark")
+    user_rows = [{"id": uuid4(), "name": f"bench user {i}", "email": f"bench-{uuid4().hex}@example.com"} for i in range(members)]
+    member_rows = [{"id": uuid4(), "group_id": group.id, "user_id": u["id"]} for u in user_rows]
+    db.add(group)
+    db.flush()
+    db.execute(insert(models.User), user_rows)
+    db.execute(insert(models.GroupMember), member_rows)
+
+    member_ids = [m["id"] for m in member_rows]
+    start = datetime.utcnow() - timedelta(days=365)
+    chunk = 5000
+    for offset in range(0, expenses, chunk):
+        expense_rows, split_rows = [], []
+        for i in range(offset, min(offset + chunk, expenses)):
+            amount = Decimal(random.randint(100, 100000)) / 100
+            expense_id = uuid4()
+            expense_rows.append({
+                "id": expense_id,
+                "description": f"expense {i}",
+                "amount": amount,
+                "paid_by": random.choice(member_ids),
+                "group_id": group.id,
+                "split_type": "EQUAL",
+                "created_at": start + timedelta(minutes=i)
+            })
+            per_head = (amount / members).quantize(Decimal("0.01"))
+            split_rows.extend(
+                {"id": uuid4(), "expense_id": expense_id, "group_id": group.id, "member_id": m, "amount": per_head}
+                for m in member_ids
+            )
+        db.execute(insert(models.Expense), expense_rows)
+        db.execute(insert(models.SplitDetail), split_rows)
+    db.commit()
+    ledger.rebuild(db, group.id)
+    ledger.rebuild_rollups(db, group.id)
+    return group.id, user_rows[0]["id"], member_ids
+
+
+# these are the pre-aggregation implementations, kept here only as the baseline to compare against
+def legacy_balance_totals(db, group_id):
+    expenses = db.query(models.Expense).filter_by(group_id=group_id).all()
+    splits = db.query(models.SplitDetail).join(models.Expense).filter(models.Expense.group_id == group_id).all()
+    paid, owed = defaultdict(float), defaultdict(float)
+    for e in expenses:
+        paid[e.paid_by] += float(e.amount)
+    for s in splits:
+        owed[s.member_id] += float(s.amount)
+    return paid, owed
+
+
+def legacy_analytics(db, group_id):
+    paid, owed = legacy_balance_totals(db, group_id)
+    expenses = db.query(models.Expense).filter_by(group_id=group_id).all()
+    timeline, cumulative = [], 0.0
+    for dt, amt in sorted((e.created_at.date(), float(e.amount)) for e in expenses):
+        cumulative += amt
+        timeline.append((dt, round(cumulative, 2)))
+    return paid, owed, timeline
+
+
+def legacy_member_summary(db, user_id):
+    memberships = db.query(models.GroupMember).filter_by(user_id=user_id).all()
+    for membership in memberships:
+        expenses = db.query(models.Expense).filter_by(group_id=membership.group_id).all()
+        splits = db.query(models.SplitDetail).join(models.Expense).filter(models.Expense.group_id == membership.group_id).all()
+        sum(float(e.amount) for e in expenses if e.paid_by == membership.id)
+        sum(float(s.amount) for s in splits if s.member_id == membership.id)
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            fn(db)
+            best = min(best, time.perf_counter() - start)
+        finally:
+            db.close()
+    return best
+
+
+def cleanup(db, group_id, member_ids):
+    db.execute(delete(models.SplitDetail).where(models.SplitDetail.group_id == group_id))
+    db.execute(delete(models.Expense).where(models.Expense.group_id == group_id))
+    db.execute(delete(models.Settlement).where(models.Settlement.group_id == group_id))
+    db.execute(delete(models.MemberBalance).where(models.MemberBalance.group_id == group_id))
+    db.execute(delete(models.DailyGroupRollup).where(models.DailyGroupRollup.group_id == group_id))
+    db.execute(delete(models.LedgerEvent).where(models.LedgerEvent.group_id == group_id))
+    user_ids = [row.user_id for row in db.query(models.GroupMember.user_id).filter(models.GroupMember.id.in_(member_ids))]
+    db.execute(delete(models.GroupMember).where(models.GroupMember.group_id == group_id))
+    db.execute(delete(models.User).where(models.User.id.in_(user_ids)))
+    db.execute(delete(models.Group).where(models.Group.id == group_id))
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Old python-loop vs SQL aggregation paths")
+    parser.add_argument("--expenses", type=int, default=100_000)
+    parser.add_argument("--members", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="leave the seeded group in the database")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    started = time.perf_counter()
+    group_id, user_id, member_ids = seed_group(db, args.expenses, args.members)
+    print(f"seeded {args.expenses} expenses x {args.members} members in {time.perf_counter() - started:.1f}s (group {group_id})")
+
+    cases = [
+        ("balance", lambda s: legacy_balance_totals(s, group_id), lambda s: crud.get_group_balance(s, group_id)),
+        ("analytics", lambda s: legacy_analytics(s, group_id), lambda s: crud.get_group_analytics(s, group_id)),
+        ("member summary", lambda s: legacy_member_summary(s, user_id), lambda s: crud.get_member_summary(s, user_id)),
+    ]
+    try:
+        print(f"{'path':<16}{'old (s)':>12}{'new (s)':>12}{'speedup':>10}")
+        for name, old, new in cases:
+            old_time = timed(old, args.repeat)
+            new_time = timed(new, args.repeat)
+            print(f"{name:<16}{old_time:>12.4f}{new_time:>12.4f}{old_time / new_time:>9.1f}x")
+    finally:
+        if not args.keep:
+            cleanup(db, group_id, member_ids)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# -> checks the money core invariants on random inputs and times it against the old Decimal / float path.
+# -> run from the project root: python -m benchmarks.bench_money --cases 20000
+import argparse
+import random
+import time
+from decimal import Decimal, ROUND_HALF_UP
+import money
+
+
+# this is how create_expense split an EQUAL expense before the money core, kept as the baseline
+def legacy_equal(amount: Decimal, count: int) -> list:
+    per_head = (amount / count).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return [per_head] * count
+
+
+# this is how create_expense split a PERCENTAGE expense before the money core
+def legacy_percentage(amount: Decimal, percentages: list) -> list:
+    return [(amount * p / 100).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) for p in percentages]
+
+
+# this is how get_group_balance netted the ledger before, float per value and round() per member
+def legacy_balances(rows: list) -> list:
+    return [round(float(paid) - float(owed) + float(sent) - float(received), 2) for paid, owed, sent, received in rows]
+
+
+def random_amount() -> Decimal:
+    return Decimal(random.randint(1, 10_000_000)).scaleb(-2)
+
+
+# this draws percentages with two decimals that add up to exactly 100
+def random_percentages(count: int) -> list:
+    cuts = sorted(random.sample(range(1, money.FULL_PERCENT), count - 1))
+    bounds = [0] + cuts + [money.FULL_PERCENT]
+    return [Decimal(b - a).scaleb(-2) for a, b in zip(bounds, bounds[1:])]
+
+
+# this is the property check: for random amounts and member counts every split sums to the total exactly,
+# no share is off by more than one cent from the exact proportional share, and nobody gets a negative share
+def check_properties(cases: int) -> int:
+    leaks = 0
+    for _ in range(cases):
+        amount = random_amount()
+        total = money.to_cents(amount)
+        count = random.randint(1, 50)
+
+        equal = money.split_equal(total, count)
+        assert int(equal.sum()) == total, (amount, count, equal)
+        assert int(equal.max()) - int(equal.min()) <= 1, (amount, count, equal)
+
+        percentages = random_percentages(count) if count <= money.FULL_PERCENT else [Decimal(100)]
+        weights = [money.percent_weight(p) for p in percentages]
+        shares = money.split_percentage(total, weights)
+        assert int(shares.sum()) == total, (amount, percentages, shares)
+        for share, weight in zip(shares.tolist(), weights):
+            assert share >= 0
+            assert abs(share * money.FULL_PERCENT - total * weight) < money.FULL_PERCENT, (amount, percentages, shares)
+
+        if sum(legacy_equal(amount, count)) != amount:
+            leaks += 1
+    return leaks
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Money core property check and micro-benchmark")
+    parser.add_argument("--cases", type=int, default=20000, help="random cases for the property check")
+    parser.add_argument("--members", type=int, default=50, help="members per split / ledger")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    leaks = check_properties(args.cases)
+    print(f"property check: {args.cases} cases ok, the legacy EQUAL split lost or added cents in {leaks} of them")
+
+    amount = Decimal("1000.00")
+    total = money.to_cents(amount)
+    percentages = random_percentages(args.members)
+    weights = [money.percent_weight(p) for p in percentages]
+    rows = [tuple(random_amount() for _ in range(4)) for _ in range(args.members)]
+    cent_rows = [tuple(money.to_cents(v) for v in row) for row in rows]
+
+    cases = [
+        ("equal split", lambda: legacy_equal(amount, args.members), lambda: money.split_equal(total, args.members)),
+        ("percentage split", lambda: legacy_percentage(amount, percentages), lambda: money.split_percentage(total, weights)),
+        ("ledger netting", lambda: legacy_balances(rows), lambda: money.net_balances(cent_rows)),
+    ]
+    print(f"{'case':<20}{'legacy ms':>12}{'cents ms':>12}")
+    for name, legacy, current in cases:
+        print(f"{name:<20}{timed(legacy, args.repeat):>12.4f}{timed(current, args.repeat):>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -> times the JSON encoding of the heavy read endpoints: the old path (response_model validation, jsonable_encoder,
+# -> stdlib json) against the one-pass orjson encoding of the crud result, and checks both give the same JSON.
+# -> the crud query is timed too, for scale. runs against the DATABASE_URL Postgres or, with --sqlite, a throwaway file.
+# -> run from the project root: python -m benchmarks.bench_serialization --members 200 --expenses 5000
+import argparse
+import json
+import os
+import tempfile
+import time
+
+
+# this is how routes.py encoded a response before: the crud dict validated against the response_model, turned
+# into JSON-able python by jsonable_encoder, then written by the stdlib encoder of starlette's JSONResponse
+def legacy_encode(result, model=None) -> bytes:
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    if model is not None:
+        result = model.model_validate(result)
+    return JSONResponse(jsonable_encoder(result)).body
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Old validate + jsonable_encoder + json path vs one-pass orjson encoding")
+    parser.add_argument("--sqlite", action="store_true", help="run against a temporary SQLite file instead of DATABASE_URL")
+    parser.add_argument("--members", type=int, default=200, help="members of the seeded group")
+    parser.add_argument("--expenses", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    # the app reads its settings on import, so they are set before anything of it is imported
+    if args.sqlite:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='serialization-'), 'serialization.db')}"
+        os.environ["DB_ASYNC"] = "false"
+
+    import crud
+    import migrate
+    import schemas
+    import serialization
+    from benchmarks import seed
+    from database import SessionLocal
+
+    migrate.upgrade()
+    db = SessionLocal()
+    dataset = seed.seed(
+        db, users=args.members, groups=1, members=args.members, expenses=args.expenses, settlements=args.members
+    )
+    group = dataset["groups"][0]
+    group_id, user_id = group["id"], group["user_ids"][0]
+    print(f"seeded 1 group, {args.members} members, {args.expenses} expenses")
+
+    cases = [
+        ("balance", lambda s: crud.get_group_balance(s, group_id), schemas.BalanceResponse),
+        ("balance greedy", lambda s: crud.get_group_balance(s, group_id, "greedy"), schemas.BalanceResponse),
+        ("analytics", lambda s: crud.get_group_analytics(s, group_id), None),
+        ("member summary", lambda s: crud.get_member_summary(s, user_id), schemas.MemberSummaryResponse),
+        ("settle plan", lambda s: crud.get_settle_plan(s, user_id), schemas.SettlePlanResponse),
+        ("members", lambda s: crud.get_members_in_group(s, group_id), None),
+    ]
+    try:
+        print(f"{'endpoint':<16}{'bytes':>9}{'query (ms)':>12}{'old (ms)':>10}{'new (ms)':>10}{'speedup':>9}  same JSON")
+        for name, compute, model in cases:
+            result = compute(db)
+            query_time = timed(lambda: compute(db), 3)
+            old_time = timed(lambda: legacy_encode(result, model), args.repeat)
+            new_time = timed(lambda: serialization.dumps(result), args.repeat)
+            body = serialization.dumps(result)
+            same = json.loads(legacy_encode(result, model)) == json.loads(body)
+            print(
+                f"{name:<16}{len(body):>9}{query_time * 1000:>12.2f}{old_time * 1000:>10.3f}{new_time * 1000:>10.3f}"
+                f"{old_time / new_time:>8.1f}x  {'yes' if same else 'NO'}"
+            )
+    finally:
+        seed.cleanup(db, dataset)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
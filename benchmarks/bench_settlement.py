@@ -0,0 +1,60 @@
+# -> compares transfer counts and runtime of the settlement strategies over random balance distributions.
+# -> run from the project root: python -m benchmarks.bench_settlement --groups 200
+import argparse
+import random
+import statistics
+import time
+import settlement
+
+
+# this is the nested debtor x creditor loop get_group_balance used before the settlement engine, kept as the baseline
+def legacy(balances: dict) -> list:
+    debtors = {k: v for k, v in balances.items() if v < 0}
+    creditors = {k: v for k, v in balances.items() if v > 0}
+    transfers = []
+    for debtor_id in debtors:
+        for creditor_id in creditors:
+            if debtors[debtor_id] == 0:
+                break
+            transfer = min(-debtors[debtor_id], creditors[creditor_id])
+            if transfer > 0:
+                transfers.append((debtor_id, creditor_id, transfer))
+                debtors[debtor_id] += transfer
+                creditors[creditor_id] -= transfer
+    return transfers
+
+
+# this draws balances that net to zero; "round" amounts make zero-sum subgroups (and exact savings) common
+def random_balances(members: int, distribution: str) -> dict:
+    if distribution == "round":
+        values = [random.choice([-1, 1]) * random.randint(1, 10) * 500 for _ in range(members - 1)]
+    else:
+        values = [random.randint(-100_000, 100_000) for _ in range(members - 1)]
+    values.append(-sum(values))
+    return {f"m{i}": v for i, v in enumerate(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Settlement strategy transfer counts and runtime")
+    parser.add_argument("--groups", type=int, default=200, help="random groups per size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 8, 12, 16, 20])
+    args = parser.parse_args()
+
+    strategies = {"legacy": legacy, **settlement.STRATEGIES}
+    print(f"{'dist':<8}{'members':>8}" + "".join(f"{name + ' tx':>12}{name + ' ms':>12}" for name in strategies))
+    for distribution in ("round", "uniform"):
+        for size in args.sizes:
+            samples = [random_balances(size, distribution) for _ in range(args.groups)]
+            row = f"{distribution:<8}{size:>8}"
+            for fn in strategies.values():
+                counts, times = [], []
+                for balances in samples:
+                    start = time.perf_counter()
+                    counts.append(len(fn(dict(balances))))
+                    times.append((time.perf_counter() - start) * 1000)
+                row += f"{statistics.mean(counts):>12.2f}{statistics.mean(times):>12.3f}"
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
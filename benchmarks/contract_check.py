@@ -0,0 +1,194 @@
+# -> end to end checks of the rules the write endpoints promise, driven through the app in-process: bad input is
+# -> turned away with a 4xx and leaves the balances as they were. exits with 1 if any rule is broken, the groups
+# -> it creates are removed again.
+# -> run from the project root: python -m benchmarks.contract_check [--sqlite]
+import argparse
+import os
+import sys
+import tempfile
+import uuid
+
+
+# this makes a group of the given users (new ones by default) and returns its id and members. it is recorded in
+# seeded so it gets removed at the end
+def new_group(client, seeded: list, emails: list = None) -> tuple:
+    emails = emails or [f"contract-{uuid.uuid4().hex}@example.com" for _ in range(3)]
+    group = client.post("/groups", json={"name": "contract check", "description": "contract_check"}).json()
+    added = client.post(f"/groups/{group['id']}/members", json={"members": [
+        {"email": email, "name": f"contract user {email[9:17]}"} for email in emails
+    ]}).json()["members_added"]
+    seeded.append((group["id"], added))
+    return group["id"], added
+
+
+def add_expense(client, group_id: str, paid_by: str, amount: str, member_ids: list):
+    response = client.post(f"/groups/{group_id}/expenses", json={
+        "description": "contract check",
+        "amount": amount,
+        "paid_by": paid_by,
+        "split_type": "EQUAL",
+        "split_details": [{"group_member_id": m} for m in member_ids]
+    })
+    response.raise_for_status()
+
+
+def balances(client, group_id: str) -> dict:
+    return {m["member_id"]: m["balance"] for m in client.get(f"/groups/{group_id}/balance").json()["member_summaries"]}
+
+
+# this sends each request and expects the status, and the group's balances to be unchanged when it is a 4xx
+def expect(client, group_id: str, cases: list) -> list:
+    failures = []
+    for name, (method, path, body), status in cases:
+        before = balances(client, group_id)
+        response = client.request(method, path, json=body)
+        if response.status_code != status:
+            failures.append(f"{name}: {response.status_code} instead of {status} ({response.text[:200]})")
+        elif status >= 400 and balances(client, group_id) != before:
+            failures.append(f"{name}: rejected but the balances changed")
+    return failures
+
+
+def check_settlements(client, seeded: list) -> list:
+    group_id, members = new_group(client, seeded)
+    member_ids = [m["id"] for m in members]
+    creditor, debtor = member_ids[:2]
+    add_expense(client, group_id, creditor, "90.00", member_ids)
+
+    def settle(from_id, to_id, amount):
+        return ("POST", f"/groups/{group_id}/settle", {
+            "from_group_member_id": from_id, "to_group_member_id": to_id, "amount": amount
+        })
+
+    return expect(client, group_id, [
+        ("negative settlement", settle(debtor, creditor, "-5"), 400),
+        ("zero settlement", settle(debtor, creditor, "0"), 400),
+        ("settlement rounding to zero", settle(debtor, creditor, "0.004"), 400),
+        ("settlement with oneself", settle(debtor, debtor, "5"), 400),
+        ("settlement above the debt", settle(debtor, creditor, "30.01"), 400),
+        ("settlement of the debt", settle(debtor, creditor, "30.00"), 200),
+    ])
+
+
+def check_expenses(client, seeded: list) -> list:
+    group_id, members = new_group(client, seeded)
+    a, b = [m["id"] for m in members][:2]
+
+    def percentage_expense(*percentages):
+        return {
+            "description": "contract check",
+            "amount": "10.00",
+            "paid_by": a,
+            "split_type": "PERCENTAGE",
+            "split_details": [{"group_member_id": m, "percentage": p} for m, p in zip((a, b), percentages)]
+        }
+
+    failures = expect(client, group_id, [
+        ("negative percentage", ("POST", f"/groups/{group_id}/expenses", percentage_expense("700", "-600")), 400),
+        ("percentage above 100", ("POST", f"/groups/{group_id}/expenses", percentage_expense("100.01", "-0.01")), 400),
+        ("percentage with 3 decimals", ("POST", f"/groups/{group_id}/expenses", percentage_expense("33.333", "66.667")), 400),
+        ("valid percentages", ("POST", f"/groups/{group_id}/expenses", percentage_expense("40", "60")), 200),
+    ])
+
+    # a bad row of a bulk import is reported and skipped, the others still go in
+    response = client.post(f"/groups/{group_id}/expenses/bulk", json=[
+        percentage_expense("50", "50"), percentage_expense("700", "-600"), percentage_expense("25", "75")
+    ])
+    result = response.json() if response.status_code == 200 else {}
+    if response.status_code != 200 or result["inserted"] != 2 or [e["row"] for e in result["errors"]] != [2]:
+        failures.append(f"bulk import with a bad percentage row: {response.status_code} {response.text[:200]}")
+    return failures
+
+
+# this records every settlement the plans of the users ask for and expects every balance to end at zero. the
+# groups share users and the debts run both ways, so a plan nets a credit in one group against a debt in another
+def check_settle_plan(client, seeded: list) -> list:
+    emails = [f"contract-{uuid.uuid4().hex}@example.com" for _ in range(4)]
+    trip, trip_members = new_group(client, seeded, emails[:3])
+    flat, flat_members = new_group(client, seeded, emails[1:])
+    a, b, c = [m["id"] for m in trip_members]
+    add_expense(client, trip, a, "50.00", [a, b, c])
+    add_expense(client, trip, b, "40.00", [b, c])
+    add_expense(client, trip, c, "10.00", [a, b, c])
+    b, c, d = [m["id"] for m in flat_members]
+    add_expense(client, flat, c, "60.00", [b, c, d])
+    add_expense(client, flat, d, "25.55", [b, d])
+
+    failures = []
+    users = {m["user_id"] for m in trip_members + flat_members}
+    settlements = {}
+    for user_id in users:
+        plan = client.get(f"/members/{user_id}/settle-plan").json()
+        overall = client.get(f"/members/{user_id}/summary").json()["overall_balance"]
+        if plan["net_balance"] != overall:
+            failures.append(f"settle plan net {plan['net_balance']} instead of the summary's {overall}")
+        for transfer in plan["transfers"]:
+            for group in transfer["groups"]:
+                key = (group["group_id"], group["from_member_id"], group["to_member_id"])
+                settlements[key] = group["amount"].lstrip("-")
+
+    for (group_id, from_id, to_id), amount in settlements.items():
+        response = client.post(f"/groups/{group_id}/settle", json={
+            "from_group_member_id": from_id, "to_group_member_id": to_id, "amount": amount
+        })
+        if response.status_code != 200:
+            failures.append(f"planned settlement of {amount} rejected: {response.text[:200]}")
+
+    for group_id in (trip, flat):
+        left = {member: cents for member, cents in balances(client, group_id).items() if cents != "0.00"}
+        if left:
+            failures.append(f"balances left after settling the plans: {left}")
+    for user_id in users:
+        if client.get(f"/members/{user_id}/settle-plan").json()["transfers"]:
+            failures.append("a settle plan still has transfers after everything was settled")
+    return failures
+
+
+CHECKS = [
+    ("settlements", check_settlements),
+    ("expenses", check_expenses),
+    ("settle plan", check_settle_plan),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if a write endpoint accepts what it should turn away")
+    parser.add_argument("--sqlite", action="store_true", help="run against a temporary SQLite file instead of DATABASE_URL")
+    args = parser.parse_args()
+
+    # the app reads its settings on import, so they are set before anything of it is imported
+    if args.sqlite:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='contract-'), 'contract.db')}"
+        os.environ["DB_ASYNC"] = "false"
+    os.environ["CACHE_BACKEND"] = "none"
+
+    from fastapi.testclient import TestClient
+    from benchmarks.bench_aggregation import cleanup
+    from database import SessionLocal
+    from main import app
+
+    failures = []
+    seeded = []
+    db = SessionLocal()
+    try:
+        # a server error is reported as a broken rule like any other wrong status
+        with TestClient(app, raise_server_exceptions=False) as client:
+            for name, check in CHECKS:
+                found = check(client, seeded)
+                print(f"{name}: {'ok' if not found else f'{len(found)} broken'}")
+                failures += found
+    finally:
+        # a user goes with the last group they are in, cleanup deletes the users of the members it is given
+        for i, (group_id, members) in enumerate(seeded):
+            later = {m["user_id"] for _, others in seeded[i + 1:] for m in others}
+            cleanup(db, uuid.UUID(group_id), [uuid.UUID(m["id"]) for m in members if m["user_id"] not in later])
+        db.close()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print(f"{len(failures)} rule(s) broken")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
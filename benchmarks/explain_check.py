@@ -0,0 +1,113 @@
+# -> seeds a large dataset, runs the read paths of crud and EXPLAINs every SELECT they issue.
+# -> exits with 1 if any of them plans a sequential scan, so a missing index shows up before production does,
+# -> or reads every partition of a partitioned table, so a query that lost its group_id filter shows up too.
+# -> postgres only. run from the project root: python -m benchmarks.explain_check --groups 100 --expenses 500
+import argparse
+import re
+import sys
+from collections import Counter, defaultdict
+from sqlalchemy import event, text
+import crud
+import database
+from database import SessionLocal
+from benchmarks.bench_aggregation import cleanup, seed_group
+
+
+def capture_statements(fn) -> list:
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(database.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        db = SessionLocal()
+        try:
+            fn(db)
+        finally:
+            db.close()
+    finally:
+        event.remove(database.engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if a crud read path plans a sequential scan")
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--expenses", type=int, default=500, help="expenses per group")
+    parser.add_argument("--members", type=int, default=5)
+    parser.add_argument("--min-rows", type=int, default=10_000, help="seq scans on smaller tables are fine and ignored")
+    parser.add_argument("--keep", action="store_true", help="leave the seeded groups in the database")
+    args = parser.parse_args()
+
+    if database.engine.dialect.name != "postgresql":
+        sys.exit("explain_check needs a postgres DATABASE_URL")
+
+    db = SessionLocal()
+    seeded = [seed_group(db, args.expenses, args.members) for _ in range(args.groups)]
+    # VACUUM also sets the visibility map, so the planner can cost index-only scans the way production would
+    with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE"))
+    # the probed group shares its partition with the most other groups: alone in one, a seq scan of the
+    # partition is the group's own rows and the planner rightly picks it, which production never sees
+    with database.engine.connect() as conn:
+        partition_of = dict(conn.execute(text("SELECT DISTINCT group_id, tableoid FROM expenses")).all())
+    crowding = Counter(partition_of.values())
+    group_id, user_id, member_ids = max(seeded, key=lambda g: crowding[partition_of.get(g[0])])
+
+    paths = {
+        "get_group_balance": lambda s: crud.get_group_balance(s, group_id),
+        "get_group_balances": lambda s: crud.get_group_balances(s, [g for g, _, _ in seeded[:20]]),
+        "get_group_analytics": lambda s: crud.get_group_analytics(s, group_id),
+        "get_members_in_group": lambda s: crud.get_members_in_group(s, group_id),
+        "get_member_summary": lambda s: crud.get_member_summary(s, user_id),
+        "get_settle_plan": lambda s: crud.get_settle_plan(s, user_id),
+        "list_expenses": lambda s: crud.list_expenses(s, group_id, include_splits=True),
+        "list_expenses deep page": lambda s: crud.list_expenses(
+            s, group_id, crud.list_expenses(s, group_id, limit=args.expenses // 2).next_cursor, member_id=member_ids[0]
+        ),
+    }
+
+    failures = 0
+    try:
+        with database.engine.connect() as conn:
+            sizes = dict(conn.execute(text("SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'")).all())
+            # a partition counts with the size of its whole table, a seq scan of one still reads many groups
+            parents = dict(conn.execute(text(
+                "SELECT c.relname, p.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent"
+            )).all())
+            partitions = Counter(parents.values())
+            for partition, parent in parents.items():
+                sizes[parent] = sizes.get(parent, 0) + max(sizes.get(partition, 0), 0)
+            for name, fn in paths.items():
+                for statement, parameters in capture_statements(fn):
+                    plan = "\n".join(row[0] for row in conn.exec_driver_sql("EXPLAIN " + statement, parameters))
+                    scanned = [
+                        t for t in re.findall(r"Seq Scan on (\w+)", plan) if sizes.get(parents.get(t, t), 0) >= args.min_rows
+                    ]
+                    read = defaultdict(set)
+                    for t in re.findall(r"Scan(?: using \w+)? on (\w+)", plan):
+                        if t in parents:
+                            read[parents[t]].add(t)
+                    unpruned = [t for t, seen in read.items() if partitions[t] > 1 and len(seen) == partitions[t]]
+                    if scanned:
+                        failures += 1
+                        print(f"SEQ SCAN on {', '.join(scanned)} in {name}:\n{statement}\n{plan}\n")
+                    if unpruned:
+                        failures += 1
+                        print(f"EVERY PARTITION of {', '.join(unpruned)} in {name}:\n{statement}\n{plan}\n")
+                print(f"{name}: checked")
+    finally:
+        if not args.keep:
+            for seeded_group_id, _, member_ids in seeded:
+                cleanup(db, seeded_group_id, member_ids)
+        db.close()
+
+    print(f"{failures} statement(s) with a sequential scan or without partition pruning")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# -> seeds a group with about a million export rows and streams its export in a fresh process,
+# -> failing if the peak RSS of that process grows by more than the ceiling while exporting.
+# -> run from the project root: python -m benchmarks.export_memory --expenses 250000 --members 3
+import argparse
+import resource
+import subprocess
+import sys
+import time
+import export
+from database import SessionLocal
+from benchmarks.bench_aggregation import cleanup, seed_group
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# this runs in the child process, so the seeding above doesn't count towards the peak
+def run_export(group_id: str, fmt: str, ceiling_mb: float) -> int:
+    if fmt == "parquet":
+        import pyarrow.parquet  # noqa: F401  (imported up front so the library itself is part of the baseline)
+    baseline = peak_rss_mb()
+
+    start = time.perf_counter()
+    size = 0
+    for chunk in export.stream(group_id, fmt):
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+
+    growth = peak_rss_mb() - baseline
+    print(f"{fmt}: {size / 1024 / 1024:.1f} MB in {elapsed:.1f}s, peak RSS grew by {growth:.1f} MB (ceiling {ceiling_mb} MB)")
+    return 1 if growth > ceiling_mb else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a big group and check memory stays flat")
+    parser.add_argument("--expenses", type=int, default=250_000)
+    parser.add_argument("--members", type=int, default=3, help="every expense gets one split row per member")
+    parser.add_argument("--formats", nargs="+", default=["csv", "ndjson", "parquet"], choices=list(export.FORMATS))
+    parser.add_argument("--ceiling-mb", type=float, default=64)
+    parser.add_argument("--export", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.export:
+        sys.exit(run_export(args.export, args.formats[0], args.ceiling_mb))
+
+    db = SessionLocal()
+    group_id, _, member_ids = seed_group(db, args.expenses, args.members)
+    print(f"seeded {args.expenses * (args.members + 1)} rows")
+
+    failures = 0
+    try:
+        for fmt in args.formats:
+            failures += subprocess.run([
+                sys.executable, "-m", "benchmarks.export_memory",
+                "--export", str(group_id), "--formats", fmt, "--ceiling-mb", str(args.ceiling_mb)
+            ]).returncode
+    finally:
+        cleanup(db, group_id, member_ids)
+        db.close()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# -> load test for the sync and async database modes against a local Postgres.
+# -> it starts uvicorn once per mode (DB_ASYNC=0 / DB_ASYNC=1), seeds a group through the API and
+# -> hammers the read endpoints with concurrent clients, then prints requests/sec and latency percentiles.
+# -> run from the project root: python -m benchmarks.loadtest --concurrency 100 --duration 15
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+import httpx
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not come up")
+
+
+# this creates one group with a few members and expenses, and returns the paths the workers will hit
+async def seed(client: httpx.AsyncClient, members: int, expenses: int) -> list:
+    group = (await client.post("/groups", json={"name": "load test", "description": "loadtest"})).json()
+    added = (await client.post(f"/groups/{group['id']}/members", json={"members": [
+        {"email": f"load-{uuid.uuid4().hex}@example.com", "name": f"load user {uuid.uuid4().hex[:8]}"}
+        for _ in range(members)
+    ]})).json()["members_added"]
+    member_ids = [m["id"] for m in added]
+    for i in range(expenses):
+        await client.post(f"/groups/{group['id']}/expenses", json={
+            "description": f"expense {i}",
+            "amount": str(random.randint(100, 10000) / 100),
+            "paid_by": random.choice(member_ids),
+            "split_type": "EQUAL",
+            "split_details": [{"group_member_id": m} for m in member_ids]
+        })
+    return [
+        f"/groups/{group['id']}/balance",
+        f"/groups/{group['id']}/analytics",
+        f"/groups/{group['id']}/members",
+        f"/members/{added[0]['user_id']}/summary",
+    ]
+
+
+async def worker(client: httpx.AsyncClient, paths: list, deadline: float, latencies: list, errors: list):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(random.choice(paths))
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(base_url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        await wait_until_up(client)
+        paths = await seed(client, args.members, args.expenses)
+        latencies, errors = [], []
+        started = time.monotonic()
+        await asyncio.gather(*(
+            worker(client, paths, started + args.duration, latencies, errors)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.monotonic() - started
+
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": cuts[49] * 1000,
+        "p99_ms": cuts[98] * 1000,
+    }
+
+
+def start_server(mode: str, port: int) -> subprocess.Popen:
+    env = {**os.environ, "DB_ASYNC": "1" if mode == "async" else "0"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Requests/sec and p99 latency for the sync and async DB modes")
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--url", help="test an already running server instead of starting one per mode")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--members", type=int, default=10)
+    parser.add_argument("--expenses", type=int, default=100)
+    args = parser.parse_args()
+
+    targets = [("external", args.url)] if args.url else [(mode, f"http://127.0.0.1:{args.port}") for mode in args.modes]
+    print(f"{'mode':<10}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode, url in targets:
+        server = None if args.url else start_server(mode, args.port)
+        try:
+            result = asyncio.run(run(url, args))
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+        print(f"{mode:<10}{result['requests']:>10}{result['errors']:>8}{result['rps']:>10.1f}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+# -> synthetic data generator: users, groups, members, expenses with mixed EQUAL / EXACT / PERCENTAGE splits and
+# -> settlements, written with bulk inserts. splits are stored compact or as rows following COMPACT_SPLITS. the ledger events, balance snapshots and daily rollups are worked out
+# -> here as well, so the seeded data looks exactly like data written through the API (ledger.py verify agrees).
+# -> the same --seed gives the same amounts, splits and dates, the ids and emails are new on every run.
+# -> run from the project root: python -m benchmarks.seed --groups 20 --members 8 --expenses 2000 --settlements 100
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import delete, func, insert
+import config
+import models
+import money
+import splits
+from database import SessionLocal
+
+CHUNK_SIZE = 5000
+SPLIT_TYPES = ("EQUAL", "EXACT", "PERCENTAGE")
+
+
+# this cuts total into parts random shares that add up to it exactly, every part at least one cent
+def random_parts(rng: random.Random, total: int, parts: int) -> list:
+    cuts = sorted(rng.sample(range(1, total), parts - 1)) if parts > 1 else []
+    return [b - a for a, b in zip([0] + cuts, cuts + [total])]
+
+
+# render_nulls keeps rows that leave some columns None in the same executemany as the rest
+def _insert_chunked(db, model, rows: list):
+    for offset in range(0, len(rows), CHUNK_SIZE):
+        db.execute(insert(model).execution_options(render_nulls=True), rows[offset:offset + CHUNK_SIZE])
+
+
+# this builds the expenses of one group with their splits, ledger events and rollup deltas
+def _expenses(rng: random.Random, group_id, member_ids: list, count: int, start: datetime, days: int, state: dict):
+    expense_rows, split_rows = [], []
+    for i in range(count):
+        total = rng.randint(100, 50000)
+        most = min(len(member_ids), total)
+        participants = rng.sample(member_ids, k=rng.randint(min(2, most), most))
+        split_type = SPLIT_TYPES[i % len(SPLIT_TYPES)]
+        percentages, weights = [None] * len(participants), None
+        if split_type == "EQUAL":
+            shares = money.split_equal(total, len(participants)).tolist()
+        elif split_type == "EXACT":
+            shares = random_parts(rng, total, len(participants))
+        else:
+            weights = random_parts(rng, money.FULL_PERCENT, len(participants))
+            shares = money.split_percentage(total, weights).tolist()
+            percentages = [money.from_cents(w) for w in weights]
+
+        compact = {"split_rule": None, "split_members": None}
+        if config.COMPACT_SPLITS and split_type in splits.RULES:
+            compact = {"split_rule": split_type, "split_members": splits.pack(participants, weights)}
+
+        expense_id = uuid4()
+        payer = rng.choice(member_ids)
+        created_at = start + timedelta(seconds=rng.randint(0, days * 86400))
+        expense_rows.append({
+            "id": expense_id,
+            "description": f"seeded expense {i}",
+            "amount": money.from_cents(total),
+            "paid_by": payer,
+            "group_id": group_id,
+            "split_type": split_type,
+            "created_at": created_at,
+            **compact
+        })
+        state["events"].append(("expense", expense_id, payer, "paid", total, created_at))
+        state["totals"][payer]["total_paid"] += total
+        for member_id, cents, percentage in zip(participants, shares, percentages):
+            if not compact["split_rule"]:
+                split_rows.append({
+                    "id": uuid4(),
+                    "expense_id": expense_id,
+                    "group_id": group_id,
+                    "member_id": member_id,
+                    "amount": money.from_cents(cents),
+                    "percentage": percentage
+                })
+            state["events"].append(("split", expense_id, member_id, "owed", cents, created_at))
+            state["totals"][member_id]["total_owed"] += cents
+        day = state["rollups"][created_at.date()]
+        day[0] += total
+        day[1] += 1
+    return expense_rows, split_rows
+
+
+def _net(totals: dict) -> int:
+    return totals["total_paid"] - totals["total_owed"] + totals["total_sent"] - totals["total_received"]
+
+
+# settlements go from members who owe to members who get back, each one covering at most half of what the payer owes
+def _settlements(rng: random.Random, group_id, member_ids: list, count: int, start: datetime, days: int, state: dict):
+    rows = []
+    for _ in range(count):
+        nets = {m: _net(state["totals"][m]) for m in member_ids}
+        debtors = [m for m, cents in nets.items() if cents < 0]
+        creditors = [m for m, cents in nets.items() if cents > 0]
+        if not debtors or not creditors:
+            break
+        from_member, to_member = rng.choice(debtors), rng.choice(creditors)
+        cents = rng.randint(1, max(1, int(-nets[from_member]) // 2))
+        settlement_id = uuid4()
+        settled_at = start + timedelta(seconds=rng.randint(0, days * 86400))
+        rows.append({
+            "id": settlement_id,
+            "group_id": group_id,
+            "from_member_id": from_member,
+            "to_member_id": to_member,
+            "amount": money.from_cents(cents),
+            "settled_at": settled_at
+        })
+        state["events"].append(("settlement", settlement_id, from_member, "sent", cents, settled_at))
+        state["events"].append(("settlement", settlement_id, to_member, "received", cents, settled_at))
+        state["totals"][from_member]["total_sent"] += cents
+        state["totals"][to_member]["total_received"] += cents
+    return rows
+
+
+def seed(
+    db,
+    users: int = 200,
+    groups: int = 20,
+    members: int = 8,
+    expenses: int = 500,
+    settlements: int = 50,
+    days: int = 365,
+    seed_value: int = 42
+) -> dict:
+    rng = random.Random(seed_value)
+    members = min(members, users)
+    start = datetime.utcnow().replace(microsecond=0) - timedelta(days=days)
+
+    user_rows = [
+        {"id": uuid4(), "name": f"seed user {i}", "email": f"seed-{uuid4().hex}@example.com"}
+        for i in range(users)
+    ]
+    _insert_chunked(db, models.User, user_rows)
+
+    dataset = {"user_ids": [u["id"] for u in user_rows], "groups": []}
+    for g in range(groups):
+        group_id = uuid4()
+        db.execute(insert(models.Group), [{
+            "id": group_id, "name": f"seed group {g}", "description": "benchmarks.seed", "created_at": start
+        }])
+        member_rows = [
+            {"id": uuid4(), "group_id": group_id, "user_id": user["id"]}
+            for user in rng.sample(user_rows, k=members)
+        ]
+        db.execute(insert(models.GroupMember), member_rows)
+        member_ids = [m["id"] for m in member_rows]
+
+        state = {
+            "events": [],
+            "totals": {m: dict.fromkeys(("total_paid", "total_owed", "total_sent", "total_received"), 0) for m in member_ids},
+            "rollups": defaultdict(lambda: [0, 0]),
+        }
+        expense_rows, split_rows = _expenses(rng, group_id, member_ids, expenses, start, days, state)
+        settlement_rows = _settlements(rng, group_id, member_ids, settlements, start, days, state)
+        _insert_chunked(db, models.Expense, expense_rows)
+        _insert_chunked(db, models.SplitDetail, split_rows)
+        _insert_chunked(db, models.Settlement, settlement_rows)
+
+        # the events go in in time order, the snapshots then cover all of them
+        state["events"].sort(key=lambda event: event[-1])
+        _insert_chunked(db, models.LedgerEvent, [
+            {
+                "group_id": group_id,
+                "member_id": member_id,
+                "kind": kind,
+                "reference_id": reference_id,
+                **dict.fromkeys(("paid", "owed", "sent", "received"), 0),
+                column: money.from_cents(cents),
+                "created_at": created_at
+            }
+            for kind, reference_id, member_id, column, cents, created_at in state["events"]
+        ])
+        last_event_id = db.query(func.max(models.LedgerEvent.id)).filter(models.LedgerEvent.group_id == group_id).scalar() or 0
+        db.execute(insert(models.MemberBalance), [
+            {
+                "member_id": member_id,
+                "group_id": group_id,
+                **{col: money.from_cents(cents) for col, cents in totals.items()},
+                "last_event_id": last_event_id
+            }
+            for member_id, totals in state["totals"].items()
+        ])
+        if state["rollups"]:
+            db.execute(insert(models.DailyGroupRollup), [
+                {"group_id": group_id, "day": day, "total_amount": money.from_cents(cents), "expense_count": count}
+                for day, (cents, count) in state["rollups"].items()
+            ])
+        db.commit()
+
+        nets = [_net(totals) for totals in state["totals"].values()]
+        dataset["groups"].append({
+            "id": group_id,
+            "member_ids": member_ids,
+            "user_ids": [m["user_id"] for m in member_rows],
+            "expense_ids": [e["id"] for e in expense_rows],
+            "debtors": [m for m, cents in zip(member_ids, nets) if cents < 0],
+            "creditors": [m for m, cents in zip(member_ids, nets) if cents > 0],
+        })
+    return dataset
+
+
+# this removes everything seed() wrote
+def cleanup(db, dataset: dict):
+    group_ids = [g["id"] for g in dataset["groups"]]
+    for model in (
+        models.SplitDetail, models.Expense, models.Settlement, models.LedgerEvent, models.MemberBalance, models.DailyGroupRollup
+    ):
+        db.execute(delete(model).where(model.group_id.in_(group_ids)))
+    db.execute(delete(models.GroupMember).where(models.GroupMember.group_id.in_(group_ids)))
+    db.execute(delete(models.Group).where(models.Group.id.in_(group_ids)))
+    db.execute(delete(models.User).where(models.User.id.in_(dataset["user_ids"])))
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed synthetic groups, expenses and settlements")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--members", type=int, default=8, help="members per group")
+    parser.add_argument("--expenses", type=int, default=500, help="expenses per group")
+    parser.add_argument("--settlements", type=int, default=50, help="settlements per group")
+    parser.add_argument("--days", type=int, default=365, help="spread the expenses over this many days")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        dataset = seed(db, args.users, args.groups, args.members, args.expenses, args.settlements, args.days, args.seed)
+    finally:
+        db.close()
+    expenses = sum(len(g["expense_ids"]) for g in dataset["groups"])
+    print(f"seeded {len(dataset['user_ids'])} users, {len(dataset['groups'])} groups, {expenses} expenses "
+          f"in {time.perf_counter() - start:.1f}s")
+    print("group ids:", " ".join(str(g["id"]) for g in dataset["groups"][:5]), "..." if len(dataset["groups"]) > 5 else "")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# -> statement budget check: seeds a small and a large group, calls every endpoint once against each with
+# -> DB_STRICT_LOADING on, and counts the SQL statements of every call from its Server-Timing header.
+# -> it fails when an endpoint goes over its budget, when its count grows with the size of the group (an N+1),
+# -> or when a relationship is read without being loaded up front (strict loading turns that into a 500).
+# -> the per user endpoints are also called for a user in one group and a user in many, and fail when their count
+# -> grows with the number of groups the user is in.
+# -> run from the project root: python -m benchmarks.statement_budget [--sqlite]
+import argparse
+import os
+import re
+import sys
+import tempfile
+from uuid import uuid4
+
+STATEMENTS = re.compile(r"(\d+) statements")
+
+# the most statements each endpoint may run, cache off
+BUDGETS = {
+    "list_members": 1,
+    "list_expenses": 2,
+    "list_expenses_with_splits": 3,
+    "balance": 2,
+    "balances_batch": 2,
+    "analytics": 3,
+    "member_summary": 2,
+    "settle_plan": 3,
+    "create_group": 1,
+    "add_members": 7,
+    "create_expense_equal": 7,
+    "create_expense_exact": 8,
+    "create_expense_percentage": 7,
+    "settle": 6,
+    "bulk_import": 12,
+    "delete_expense": 6,
+}
+
+
+def _equal(group: dict) -> dict:
+    return {
+        "description": "budget", "amount": "90.00", "paid_by": str(group["member_ids"][0]), "split_type": "EQUAL",
+        "split_details": [{"group_member_id": str(m)} for m in group["member_ids"]]
+    }
+
+
+def _exact(group: dict) -> dict:
+    return {
+        "description": "budget", "amount": f"{len(group['member_ids'])}.00", "paid_by": str(group["member_ids"][0]),
+        "split_type": "EXACT", "split_details": [{"group_member_id": str(m), "amount": "1.00"} for m in group["member_ids"]]
+    }
+
+
+def _percentage(group: dict) -> dict:
+    return {
+        "description": "budget", "amount": "90.00", "paid_by": str(group["member_ids"][0]), "split_type": "PERCENTAGE",
+        "split_details": [{"group_member_id": str(m), "percentage": "50"} for m in group["member_ids"][:2]]
+    }
+
+
+# every endpoint is (name, request builder), the builder gets one seeded group
+ENDPOINTS = [
+    ("list_members", lambda g: ("GET", f"/groups/{g['id']}/members", {})),
+    ("list_expenses", lambda g: ("GET", f"/groups/{g['id']}/expenses?limit=50", {})),
+    ("list_expenses_with_splits", lambda g: ("GET", f"/groups/{g['id']}/expenses?limit=50&include_splits=true", {})),
+    ("balance", lambda g: ("GET", f"/groups/{g['id']}/balance", {})),
+    ("balances_batch", lambda g: ("POST", "/groups/balances:batch", {"json": {"group_ids": [str(g["id"]), str(uuid4())]}})),
+    ("analytics", lambda g: ("GET", f"/groups/{g['id']}/analytics", {})),
+    ("member_summary", lambda g: ("GET", f"/members/{g['user_ids'][0]}/summary", {})),
+    ("settle_plan", lambda g: ("GET", f"/members/{g['user_ids'][0]}/settle-plan", {})),
+    ("create_group", lambda g: ("POST", "/groups", {"json": {"name": "budget group", "description": "budget"}})),
+    ("add_members", lambda g: ("POST", f"/groups/{g['id']}/members", {"json": {"members": [
+        {"email": f"budget-{uuid4().hex}@example.com", "name": f"budget user {uuid4().hex[:8]}"} for _ in range(2)
+    ]}})),
+    ("create_expense_equal", lambda g: ("POST", f"/groups/{g['id']}/expenses", {"json": _equal(g)})),
+    ("create_expense_exact", lambda g: ("POST", f"/groups/{g['id']}/expenses", {"json": _exact(g)})),
+    ("create_expense_percentage", lambda g: ("POST", f"/groups/{g['id']}/expenses", {"json": _percentage(g)})),
+    ("settle", lambda g: ("POST", f"/groups/{g['id']}/settle", {"json": {
+        "from_group_member_id": str(g["debtors"][0]), "to_group_member_id": str(g["creditors"][0]), "amount": "0.01"
+    }})),
+    ("bulk_import", lambda g: ("POST", f"/groups/{g['id']}/expenses/bulk", {"json": [_equal(g), _exact(g), _percentage(g)] * 5})),
+    ("delete_expense", lambda g: ("DELETE", f"/groups/{g['id']}/expenses/{g['expense_ids'].pop()}", {})),
+]
+
+
+# the endpoints that read every group of a user, the builder gets the user id
+USER_ENDPOINTS = [
+    ("member_summary", lambda u: ("GET", f"/members/{u}/summary", {})),
+    ("settle_plan", lambda u: ("GET", f"/members/{u}/settle-plan", {})),
+]
+
+
+def measure(client, endpoints: list, target) -> dict:
+    counts = {}
+    for name, build in endpoints:
+        method, url, kwargs = build(target)
+        response = client.request(method, url, **kwargs)
+        match = STATEMENTS.search(response.headers.get("server-timing", ""))
+        counts[name] = (response.status_code, int(match.group(1)) if match else None)
+    return counts
+
+
+# this prints one line per endpoint and returns how many failed, sizes are the column headers of results
+def report(title: str, names: list, sizes: tuple, results: dict) -> int:
+    failures = 0
+    print(f"{title:<28} {'budget':>6} {sizes[0]:>6} {sizes[1]:>6}")
+    for name in names:
+        (small_status, small), (large_status, large) = results[sizes[0]][name], results[sizes[1]][name]
+        problems = []
+        if small_status >= 300 or large_status >= 300:
+            problems.append(f"status {small_status} / {large_status}")
+        if small is None or large is None or max(small, large) > BUDGETS[name]:
+            problems.append("over budget")
+        elif large != small:
+            problems.append(f"grows with the {title}")
+        failures += bool(problems)
+        print(f"{name:<28} {BUDGETS[name]:>6} {str(small):>6} {str(large):>6}  {', '.join(problems)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if an endpoint runs more SQL statements than its budget")
+    parser.add_argument("--sqlite", action="store_true", help="run against a temporary SQLite file instead of DATABASE_URL")
+    parser.add_argument("--small", type=int, default=3, help="members of the small group")
+    parser.add_argument("--large", type=int, default=30, help="members of the large group")
+    parser.add_argument("--expenses", type=int, default=100, help="seeded expenses per group")
+    parser.add_argument("--groups", type=int, default=20, help="groups of the user in many groups")
+    args = parser.parse_args()
+
+    # the app reads its settings on import, so they are set before anything of it is imported
+    if args.sqlite:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='budget-'), 'budget.db')}"
+        os.environ["DB_ASYNC"] = "false"
+    os.environ["CACHE_BACKEND"] = "none"
+    os.environ["PROFILING"] = "true"
+    os.environ["PROFILE_SAMPLE_RATE"] = "0"
+    os.environ["DB_STRICT_LOADING"] = "true"
+
+    from fastapi.testclient import TestClient
+    from benchmarks import seed
+    from database import SessionLocal
+    from main import app
+
+    db = SessionLocal()
+    datasets = []
+    try:
+        with TestClient(app) as client:
+            results = {}
+            for size in (args.small, args.large):
+                dataset = seed.seed(db, users=size, groups=1, members=size, expenses=args.expenses, settlements=5)
+                datasets.append(dataset)
+                results[size] = measure(client, ENDPOINTS, dataset["groups"][0])
+            # every user of a dataset is a member of each of its groups
+            user_results = {}
+            for groups in (1, args.groups):
+                dataset = seed.seed(
+                    db, users=args.small, groups=groups, members=args.small, expenses=args.expenses // 10, settlements=2
+                )
+                datasets.append(dataset)
+                user_results[groups] = measure(client, USER_ENDPOINTS, dataset["user_ids"][0])
+    finally:
+        for dataset in datasets:
+            seed.cleanup(db, dataset)
+        db.close()
+
+    failures = report("group", list(BUDGETS), (args.small, args.large), results)
+    print()
+    failures += report("groups of the user", [name for name, _ in USER_ENDPOINTS], (1, args.groups), user_results)
+
+    print(f"{failures} endpoint(s) failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
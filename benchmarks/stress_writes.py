@@ -0,0 +1,161 @@
+# -> fires thousands of concurrent settlements and expenses at one group from many threads and then checks
+# -> that the ledger invariants still hold: no over-settled member, balances summing to zero, no orphan
+# -> expenses, and running totals / rollups matching the raw rows. exits with 1 if any of them is broken.
+# -> run from the project root against Postgres: python -m benchmarks.stress_writes --threads 32 --settlements 2000
+import argparse
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+from sqlalchemy import and_, func
+import ledger
+import models
+import money
+import splits
+from database import SessionLocal
+from main import app
+from benchmarks.bench_aggregation import cleanup
+
+
+# this makes one creditor and a few debtors, every debtor starting with the same debt to the creditor
+def seed(client: TestClient, debtors: int, debt: int) -> tuple:
+    group = client.post("/groups", json={"name": "stress test", "description": "stress_writes"}).json()
+    added = client.post(f"/groups/{group['id']}/members", json={"members": [
+        {"email": f"stress-{uuid.uuid4().hex}@example.com", "name": f"stress user {uuid.uuid4().hex[:8]}"}
+        for _ in range(debtors + 1)
+    ]}).json()["members_added"]
+    creditor, *debtor_ids = [m["id"] for m in added]
+    response = client.post(f"/groups/{group['id']}/expenses", json={
+        "description": "opening debt",
+        "amount": str(debt * debtors),
+        "paid_by": creditor,
+        "split_type": "EQUAL",
+        "split_details": [{"group_member_id": d} for d in debtor_ids]
+    })
+    response.raise_for_status()
+    return group["id"], creditor, debtor_ids
+
+
+# every settlement goes from a debtor to the creditor, every expense is paid by the creditor for the debtors,
+# so a debtor's balance only goes up through settlements and can never pass zero if the check holds.
+# a share of the expenses has splits that don't add up and must be rejected without leaving anything behind.
+def operations(group_id: str, creditor: str, debtor_ids: list, settlements: int, expenses: int, max_amount: int) -> list:
+    ops = []
+    for _ in range(settlements):
+        ops.append(("settlement", f"/groups/{group_id}/settle", {
+            "from_group_member_id": random.choice(debtor_ids),
+            "to_group_member_id": creditor,
+            "amount": str(random.randint(100, max_amount * 100) / 100)
+        }))
+    for i in range(expenses):
+        amount = random.randint(100, max_amount * 100)
+        members = random.sample(debtor_ids, k=random.randint(1, len(debtor_ids)))
+        if i % 4:
+            body = {"split_type": "EQUAL", "split_details": [{"group_member_id": m} for m in members]}
+        else:
+            body = {"split_type": "EXACT", "split_details": [{"group_member_id": m, "amount": "0.01"} for m in members]}
+        ops.append(("expense", f"/groups/{group_id}/expenses", {
+            "description": f"stress {i}", "amount": str(amount / 100), "paid_by": creditor, **body
+        }))
+    random.shuffle(ops)
+    return ops
+
+
+def check_invariants(db, group_id: str, creditor: str, accepted: Counter, seeded_expenses: int) -> list:
+    failures = []
+    e, s, t = models.Expense, models.SplitDetail, models.Settlement
+
+    drift = ledger.verify(db, group_id) + ledger.verify_rollups(db, group_id)
+    if drift:
+        failures.append(f"running totals drifted from the raw rows: {drift[:3]}")
+
+    tail, columns = ledger.current_totals(models.LedgerEvent.group_id == group_id)
+    rows = (
+        db.query(models.MemberBalance.member_id, *columns)
+        .outerjoin(tail, tail.c.member_id == models.MemberBalance.member_id)
+        .filter(models.MemberBalance.group_id == group_id)
+        .all()
+    )
+    balances = dict(zip([str(r[0]) for r in rows], money.net_balances([r[1:] for r in rows]).tolist()))
+    if sum(balances.values()) != 0:
+        failures.append(f"balances sum to {sum(balances.values())} cents instead of 0")
+    over = {m: cents for m, cents in balances.items() if m != creditor and cents > 0}
+    if over:
+        failures.append(f"over-settled members: {over}")
+
+    expense_count = db.query(func.count(e.id)).filter(e.group_id == group_id).scalar()
+    if expense_count != accepted["expense"] + seeded_expenses:
+        failures.append(f"{expense_count} expenses stored, {accepted['expense'] + seeded_expenses} accepted")
+    mismatched = (
+        db.query(e.id)
+        .outerjoin(s, and_(s.group_id == e.group_id, s.expense_id == e.id))
+        .filter(e.group_id == group_id, e.split_rule.is_(None))
+        .group_by(e.id, e.amount)
+        .having(func.coalesce(func.sum(s.amount), 0) != e.amount)
+        .count()
+    )
+    compact = db.query(e.amount, e.split_rule, e.split_members).filter(e.group_id == group_id, e.split_rule.isnot(None))
+    mismatched += sum(
+        1 for amount, rule, packed in compact
+        if sum(cents for _, cents, _ in splits.shares(rule, packed, money.to_cents(amount))) != money.to_cents(amount)
+    )
+    if mismatched:
+        failures.append(f"{mismatched} expenses whose splits don't add up to the amount")
+
+    settlement_count = db.query(func.count(t.id)).filter(t.group_id == group_id).scalar()
+    if settlement_count != accepted["settlement"]:
+        failures.append(f"{settlement_count} settlements stored, {accepted['settlement']} accepted")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent write stress test")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--debtors", type=int, default=5)
+    parser.add_argument("--debt", type=int, default=1000, help="opening debt of every debtor")
+    parser.add_argument("--settlements", type=int, default=2000)
+    parser.add_argument("--expenses", type=int, default=1000)
+    parser.add_argument("--max-amount", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="leave the group in the database")
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        group_id, creditor, debtor_ids = seed(client, args.debtors, args.debt)
+        ops = operations(group_id, creditor, debtor_ids, args.settlements, args.expenses, args.max_amount)
+
+        def fire(op):
+            kind, path, body = op
+            return kind, client.post(path, json=body).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(fire, ops))
+        elapsed = time.perf_counter() - start
+
+    statuses = Counter(results)
+    accepted = Counter(kind for kind, status in results if status == 200)
+    print(f"{len(ops)} writes from {args.threads} threads in {elapsed:.1f}s ({len(ops) / elapsed:.0f}/s)")
+    for (kind, status), count in sorted(statuses.items()):
+        print(f"  {kind:<10} {status}: {count}")
+
+    db = SessionLocal()
+    try:
+        failures = check_invariants(db, group_id, creditor, accepted, seeded_expenses=1)
+        if any(status >= 500 for _, status in results):
+            failures.append("some writes failed with a server error")
+        if not args.keep:
+            cleanup(db, group_id, [creditor, *debtor_ids])
+    finally:
+        db.close()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("invariants hold" if not failures else f"{len(failures)} invariant(s) broken")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
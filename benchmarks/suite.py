@@ -0,0 +1,259 @@
+# -> benchmark suite: seeds a dataset with benchmarks.seed, then drives every route in routes.py in-process
+# -> through an httpx ASGI client and reports throughput, p50/p95/p99 latency and SQL statements per request
+# -> for each of them. the results are saved as JSON so two commits can be compared with --compare.
+# -> runs against the DATABASE_URL Postgres or, with --sqlite, a throwaway SQLite file, nothing else is needed.
+# -> run from the project root:
+# ->   python -m benchmarks.suite --sqlite --requests 200 --concurrency 10
+# ->   python -m benchmarks.suite --compare benchmarks/results/old.json benchmarks/results/new.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from uuid import uuid4
+
+STATEMENTS = re.compile(r"(\d+) statements")
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _expense_body(rng: random.Random, group: dict, i: int) -> dict:
+    members = [str(m) for m in rng.sample(group["member_ids"], k=min(3, len(group["member_ids"])))]
+    split_type = ("EQUAL", "EXACT", "PERCENTAGE")[i % 3]
+    amount = f"{rng.randint(100, 50000) / 100:.2f}"
+    if split_type == "EQUAL":
+        details = [{"group_member_id": m} for m in members]
+    elif split_type == "EXACT":
+        amount = f"{10 * len(members):.2f}"
+        details = [{"group_member_id": m, "amount": "10.00"} for m in members]
+    else:
+        percentages = [100 // len(members)] * len(members)
+        percentages[0] += 100 - sum(percentages)
+        details = [{"group_member_id": m, "percentage": str(p)} for m, p in zip(members, percentages)]
+    return {
+        "description": f"suite expense {i}", "amount": amount, "paid_by": str(rng.choice(group["member_ids"])),
+        "split_type": split_type, "split_details": details
+    }
+
+
+def _delete_expense(rng, dataset, created, i):
+    group = rng.choice([g for g in dataset["groups"] if g["expense_ids"]])
+    return "DELETE", f"/groups/{group['id']}/expenses/{group['expense_ids'].pop()}", {}
+
+
+def _settle(rng, dataset, created, i):
+    group = rng.choice([g for g in dataset["groups"] if g["debtors"] and g["creditors"]])
+    return "POST", f"/groups/{group['id']}/settle", {"json": {
+        "from_group_member_id": str(rng.choice(group["debtors"])),
+        "to_group_member_id": str(rng.choice(group["creditors"])),
+        "amount": "0.01"
+    }}
+
+
+# every scenario is (name, share of --requests, request builder). a builder gets the rng, the seeded dataset and
+# a dict of things created along the way, and returns the arguments of one httpx request. they run in this order,
+# the reads and the settlements first while the balances are still the seeded ones
+SCENARIOS = [
+    ("health", 1.0, lambda rng, d, c, i: ("GET", "/", {})),
+    ("list_members", 1.0, lambda rng, d, c, i: ("GET", f"/groups/{rng.choice(d['groups'])['id']}/members", {})),
+    ("list_expenses", 1.0, lambda rng, d, c, i: ("GET", f"/groups/{rng.choice(d['groups'])['id']}/expenses?limit=50", {})),
+    ("list_expenses_with_splits", 1.0, lambda rng, d, c, i: (
+        "GET", f"/groups/{rng.choice(d['groups'])['id']}/expenses?limit=50&include_splits=true", {}
+    )),
+    ("balance", 1.0, lambda rng, d, c, i: ("GET", f"/groups/{rng.choice(d['groups'])['id']}/balance", {})),
+    ("balance_greedy", 1.0, lambda rng, d, c, i: ("GET", f"/groups/{rng.choice(d['groups'])['id']}/balance?strategy=greedy", {})),
+    ("member_summary", 1.0, lambda rng, d, c, i: ("GET", f"/members/{rng.choice(rng.choice(d['groups'])['user_ids'])}/summary", {})),
+    ("settle_plan", 1.0, lambda rng, d, c, i: ("GET", f"/members/{rng.choice(rng.choice(d['groups'])['user_ids'])}/settle-plan", {})),
+    ("analytics", 1.0, lambda rng, d, c, i: ("GET", f"/groups/{rng.choice(d['groups'])['id']}/analytics?granularity=week", {})),
+    ("export_csv", 0.05, lambda rng, d, c, i: ("GET", f"/groups/{rng.choice(d['groups'])['id']}/export?format=csv", {})),
+    ("settle", 1.0, _settle),
+    ("create_group", 0.5, lambda rng, d, c, i: ("POST", "/groups", {"json": {"name": f"suite group {i}", "description": "suite"}})),
+    ("add_members", 0.5, lambda rng, d, c, i: ("POST", f"/groups/{rng.choice(d['groups'])['id']}/members", {"json": {"members": [
+        {"email": f"suite-{uuid4().hex}@example.com", "name": f"suite user {uuid4().hex[:8]}"} for _ in range(2)
+    ]}})),
+    ("create_expense", 1.0, lambda rng, d, c, i: (
+        "POST", f"/groups/{(g := rng.choice(d['groups']))['id']}/expenses", {"json": _expense_body(rng, g, i)}
+    )),
+    ("bulk_import", 0.05, lambda rng, d, c, i: (
+        "POST", f"/groups/{(g := rng.choice(d['groups']))['id']}/expenses/bulk", {"json": [_expense_body(rng, g, j) for j in range(100)]}
+    )),
+    ("delete_expense", 0.5, _delete_expense),
+    ("metrics", 0.2, lambda rng, d, c, i: ("GET", "/metrics", {})),
+    ("metrics_cache", 0.2, lambda rng, d, c, i: ("GET", "/metrics/cache", {})),
+    ("metrics_pool", 0.2, lambda rng, d, c, i: ("GET", "/metrics/pool", {})),
+]
+
+def _percentile(cuts: list, p: int) -> float:
+    return round(cuts[p - 1] * 1000, 3) if cuts else 0.0
+
+
+async def run_scenario(client, name: str, count: int, build, rng, dataset: dict, created: dict, concurrency: int) -> dict:
+    requests = [build(rng, dataset, created, i) for i in range(count)]
+    latencies, statements, statuses = [], [], {}
+    queue = iter(requests)
+
+    async def worker():
+        for method, url, kwargs in queue:
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            match = STATEMENTS.search(response.headers.get("server-timing", ""))
+            if match:
+                statements.append(int(match.group(1)))
+            if response.status_code < 300 and name == "create_group":
+                created["group_ids"].append(response.json()["id"])
+            if response.status_code < 300 and name == "add_members":
+                created["user_ids"].extend(m["user_id"] for m in response.json()["members_added"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": _percentile(cuts, 50),
+        "p95_ms": _percentile(cuts, 95),
+        "p99_ms": _percentile(cuts, 99),
+        "mean_statements": round(statistics.mean(statements), 2) if statements else None,
+        "max_statements": max(statements) if statements else None,
+    }
+
+
+async def run_suite(args, dataset: dict, app) -> dict:
+    import httpx
+
+    rng = random.Random(args.seed)
+    created = {"group_ids": [], "user_ids": []}
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://suite", timeout=120) as client:
+        for name, share, build in SCENARIOS:
+            if args.only and name not in args.only:
+                continue
+            count = max(1, int(args.requests * share))
+            results[name] = await run_scenario(client, name, count, build, rng, dataset, created, args.concurrency)
+            r = results[name]
+            print(f"{name:<26} {r['throughput_rps']:>8.1f} req/s  p50 {r['p50_ms']:>8.2f} ms  p95 {r['p95_ms']:>8.2f} ms  "
+                  f"p99 {r['p99_ms']:>8.2f} ms  statements {r['mean_statements']}  {r['statuses']}")
+    return results, created
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    print(f"{'scenario':<26} {'req/s':>18} {'p95 ms':>22} {'statements':>16}")
+    for name, r in new["results"].items():
+        o = old["results"].get(name)
+        if o is None:
+            print(f"{name:<26} new")
+            continue
+
+        def change(a, b):
+            if a in (None, 0) or b is None:
+                return ""
+            return f"({(b - a) / a * 100:+.0f}%)"
+        print(
+            f"{name:<26} {r['throughput_rps']:>8.1f} {change(o['throughput_rps'], r['throughput_rps']):>9} "
+            f"{r['p95_ms']:>10.2f} {change(o['p95_ms'], r['p95_ms']):>11} "
+            f"{str(r['mean_statements']):>7} <- {str(o['mean_statements']):<7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive every route in-process and record latency, throughput and query counts")
+    parser.add_argument("--sqlite", action="store_true", help="run against a temporary SQLite file instead of DATABASE_URL")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario, a few heavy ones get a share of it")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--expenses", type=int, default=1000, help="seeded expenses per group")
+    parser.add_argument("--settlements", type=int, default=50, help="seeded settlements per group")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on, by default every read hits the database")
+    parser.add_argument("--only", nargs="+", help="only run these scenarios")
+    parser.add_argument("--output", help="where to write the JSON results (default benchmarks/results/<commit>-<backend>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # the app reads its settings on import, so they are set before anything of it is imported
+    if args.sqlite:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='suite-'), 'suite.db')}"
+        os.environ["DB_ASYNC"] = "false"
+    if not args.cache:
+        os.environ["CACHE_BACKEND"] = "none"
+    os.environ["PROFILING"] = "true"
+    os.environ.setdefault("PROFILE_SAMPLE_RATE", "0")
+
+    import config
+    from benchmarks import seed
+    from database import SessionLocal, engine
+    from main import app
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        dataset = seed.seed(db, users=max(args.members * 4, 50), groups=args.groups, members=args.members,
+                            expenses=args.expenses, settlements=args.settlements, seed_value=args.seed)
+        print(f"seeded {args.groups} groups x {args.expenses} expenses in {time.perf_counter() - start:.1f}s")
+
+        results, created = asyncio.run(run_suite(args, dataset, app))
+
+        dataset["groups"] += [{"id": group_id} for group_id in created["group_ids"]]
+        dataset["user_ids"] += created["user_ids"]
+        seed.cleanup(db, dataset)
+    finally:
+        db.close()
+
+    backend = engine.dialect.name
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "backend": backend,
+            "db_async": config.DB_ASYNC,
+            "cache": args.cache,
+            "python": platform.python_version(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    path = args.output or os.path.join("benchmarks", "results", f"{output['meta']['commit']}-{backend}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"results written to {path}")
+
+    failures = [name for name, r in results.items() if any(s.startswith("5") for s in r["statuses"])]
+    if failures:
+        print(f"server errors in: {', '.join(failures)}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
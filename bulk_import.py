@@ -0,0 +1,91 @@
+import csv
+import json
+import anyio
+from fastapi import Request
+from sqlalchemy.util import await_only
+
+# -> parsers for the bulk expense import, they turn a request body into (row_number, dict) pairs
+# -> for crud.bulk_create_expenses. a row that can't be parsed is passed on as a ValueError so it
+# -> gets reported with the other row errors instead of failing the whole import.
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+CSV_TYPES = {"text/csv", "application/csv"}
+
+
+# this pulls the body chunks of an async request from sync crud code while the upload is still streaming in.
+# the crud code runs either in a worker thread, or inside AsyncSession.run_sync's greenlet when in_greenlet is set.
+def iter_request_chunks(request: Request, in_greenlet: bool = False):
+    stream = request.stream()
+    while True:
+        try:
+            if in_greenlet:
+                chunk = await_only(stream.__anext__())
+            else:
+                chunk = anyio.from_thread.run(stream.__anext__)
+        except StopAsyncIteration:
+            return
+        if chunk:
+            yield chunk
+
+
+# this splits byte chunks into text lines without holding the whole body in memory
+def iter_lines(chunks):
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+
+# a JSON body is either a list of expenses or {"expenses": [...]}
+def parse_json(body: bytes):
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get("expenses")
+    if not isinstance(data, list):
+        raise ValueError('JSON body must be a list of expenses or {"expenses": [...]}')
+    return enumerate(data, start=1)
+
+
+# one JSON expense object per line, blank lines are skipped
+def parse_ndjson(lines):
+    for row_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield row_number, json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f"invalid JSON: {e}")
+
+
+# columns: description, amount, paid_by, split_type, split_details
+# split_details is "member_id;member_id" for EQUAL and "member_id:value;member_id:value" otherwise,
+# the value being the amount for EXACT and the percentage for PERCENTAGE splits
+def parse_csv(lines):
+    reader = csv.DictReader(lines)
+    for row_number, record in enumerate(reader, start=1):
+        try:
+            split_type = (record.get("split_type") or "").strip().upper()
+            value_field = "percentage" if split_type == "PERCENTAGE" else "amount"
+            split_details = []
+            for part in (record.get("split_details") or "").split(";"):
+                if not part.strip():
+                    continue
+                member_id, _, value = part.partition(":")
+                detail = {"group_member_id": member_id.strip()}
+                if value.strip():
+                    detail[value_field] = value.strip()
+                split_details.append(detail)
+
+            yield row_number, {
+                "description": record.get("description"),
+                "amount": record.get("amount"),
+                "paid_by": record.get("paid_by"),
+                "split_type": split_type,
+                "split_details": split_details
+            }
+        except (AttributeError, TypeError) as e:
+            yield row_number, ValueError(f"invalid CSV row: {e}")
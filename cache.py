@@ -0,0 +1,194 @@
+import hashlib
+import importlib
+import threading
+import time
+from collections import OrderedDict
+from uuid import UUID
+import config
+
+# -> response cache for the read endpoints (balance, analytics, member summary).
+# -> entries are tagged with the groups and users they were computed from, and the crud write
+# -> functions invalidate those tags after their commit, so a cached payload never outlives a write.
+
+
+# ids come in as path strings or as UUIDs from the models, both have to end up as the same tag
+def _normalize(value) -> str:
+    try:
+        return str(UUID(str(value)))
+    except ValueError:
+        return str(value)
+
+
+def group_tag(group_id) -> str:
+    return f"group:{_normalize(group_id)}"
+
+
+def user_tag(user_id) -> str:
+    return f"user:{_normalize(user_id)}"
+
+
+# this is the interface an external backend (redis, memcached, ...) implements to be used instead of the
+# in-process one. values are the already serialized response bodies, so any bytes store works.
+class CacheBackend:
+    # returns the stored bytes or None
+    def get(self, key: str):
+        raise NotImplementedError
+
+    # stores the value under key, tagged with tags. version is the value of current_version() taken before the
+    # payload was computed, a backend should drop the value if one of the tags got invalidated since then.
+    def set(self, key: str, value: bytes, tags, version: int):
+        raise NotImplementedError
+
+    # drops every entry carrying one of the tags
+    def invalidate(self, tags):
+        raise NotImplementedError
+
+    def current_version(self) -> int:
+        return 0
+
+    def stats(self) -> dict:
+        return {}
+
+
+# this is the default backend, a dict kept in LRU order with a TTL on every entry.
+# crud runs in worker threads in sync mode, so everything goes through one lock.
+class MemoryCache(CacheBackend):
+    def __init__(self, max_entries: int = 10000, ttl: float = 30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.invalidated_at = {}
+        self.version = 0
+        self.floor = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key: str):
+        _, _, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes, tags, version: int):
+        tags = tuple(tags)
+        with self.lock:
+            # a write committed while this payload was being computed, it may already be stale
+            if version < self.floor or any(self.invalidated_at.get(tag, 0) > version for tag in tags):
+                return
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (value, time.monotonic() + self.ttl, tags)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, tags):
+        with self.lock:
+            self.version += 1
+            for tag in tags:
+                self.invalidated_at[tag] = self.version
+                for key in list(self.tags.get(tag, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+            # the per-tag versions are only needed for payloads still being computed, when they pile up
+            # they are dropped and anything computed before this point is simply not stored
+            if len(self.invalidated_at) > self.max_entries:
+                self.invalidated_at.clear()
+                self.floor = self.version
+
+    def current_version(self) -> int:
+        with self.lock:
+            return self.version
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "backend": type(self).__name__,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+# this turns CACHE_BACKEND into a backend: "memory", "none" to turn caching off,
+# or "package.module:ClassName" for an external CacheBackend subclass built with no arguments
+def load_backend(name: str):
+    if name == "none":
+        return None
+    if name == "memory":
+        return MemoryCache(config.CACHE_MAX_ENTRIES, config.CACHE_TTL_SECONDS)
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+backend = load_backend(config.CACHE_BACKEND)
+
+
+def lookup(key: str):
+    return backend.get(key) if backend else None
+
+
+def store(key: str, value: bytes, tags, version: int):
+    if backend:
+        backend.set(key, value, tags, version)
+
+
+def current_version() -> int:
+    return backend.current_version() if backend else 0
+
+
+# -> called by crud after a write committed, group_id for the group that changed and
+# -> user_ids for users whose set of groups changed (their summaries are not tagged with the new group yet)
+def invalidate(group_id=None, user_ids=()):
+    if not backend:
+        return
+    tags = [user_tag(user_id) for user_id in user_ids]
+    if group_id is not None:
+        tags.append(group_tag(group_id))
+    backend.invalidate(tags)
+
+
+def stats() -> dict:
+    return backend.stats() if backend else {"backend": None}
+
+
+# this gives the strong ETag of a serialized body
+def etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+# this checks an If-None-Match header against an ETag, weak validators and "*" match too
+def etag_matches(if_none_match, tag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == tag for c in candidates)
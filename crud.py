@@ -1,8 +1,15 @@
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
-import models, schemas
-from uuid import uuid4, UUID
+from pydantic import ValidationError
+from sqlalchemy import func, insert, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, contains_eager, joinedload, selectinload
+import cache, config, ledger, models, money, schemas, settlement, splits
+from uuid import UUID, uuid4
 from collections import defaultdict
+from datetime import date, datetime, timedelta
+import base64
+import json
 
 
 # this will handle the error response if something goes wrong:
@@ -18,68 +25,131 @@ def error_response(code: str, message: str, details: dict, status_code: int):
         }
     )
 
+# this picks the INSERT construct of the dialect in use, both the postgres and the sqlite one support ON CONFLICT
+def dialect_insert(db: Session, model):
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite_insert(model)
+    return postgresql_insert(model)
+
+# this moves the per-day expense totals of a group, deltas is {date: [cents, expense_count]}.
+# one upsert for all the days, it only flushes like ledger.append_events.
+def apply_rollup_deltas(db: Session, group_id, deltas: dict):
+    if not deltas:
+        return
+
+    table = models.DailyGroupRollup.__table__
+    stmt = dialect_insert(db, models.DailyGroupRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["group_id", "day"],
+        set_={
+            "total_amount": table.c.total_amount + stmt.excluded.total_amount,
+            "expense_count": table.c.expense_count + stmt.excluded.expense_count
+        }
+    )
+    db.execute(stmt, [
+        {"group_id": group_id, "day": day, "total_amount": money.from_cents(cents), "expense_count": count}
+        for day, (cents, count) in deltas.items()
+    ])
+
 # -> this function creates a new group and commit it to the daatbase
 def create_group(db: Session, group: schemas.GroupCreate):
     new_group = models.Group(**group.dict())
     db.add(new_group)
     db.commit()
-    db.refresh(new_group)
     return new_group
 
-# this adds member into the group
+# this adds member into the group, with a fixed number of statements however many members come in
 def add_members(db: Session, group_id: str, members: schemas.MemberAddRequest) -> schemas.MemberAddResponse:
     group = db.query(models.Group).filter_by(id=group_id).first()
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
-    added = []
-    for m in members.members:
-        # Check if a member with the same name already exists in the group
-        name_conflict = (
-            db.query(models.GroupMember)
-            .join(models.User)
-            .filter(
-                models.GroupMember.group_id == group_id,
-                models.User.name == m.name
-            )
-            .first()
-        )
-        if name_conflict:
+    # Check if a member with the same name already exists in the group, or comes twice in the request.
+    # name is optional, members added by email alone are never duplicates of each other
+    names = [m.name for m in members.members if m.name is not None]
+    taken = {
+        name for (name,) in db.query(models.User.name)
+        .join(models.GroupMember, models.GroupMember.user_id == models.User.id)
+        .filter(models.GroupMember.group_id == group.id, models.User.name.in_(names))
+    }
+    seen = set()
+    for name in names:
+        if name in taken or name in seen:
             error_response(
                 code="DUPLICATE RESOURCE",
                 message="Member already exists",
                 details={
-                    "name": m.name
+                    "name": name
                 },
                 status_code=409
             )
+        seen.add(name)
 
-        # Create or fetch user
-        user = db.query(models.User).filter_by(email=m.email).first()
-        if not user:
-            user = models.User(name=m.name, email=m.email)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-
-        # Check if this user is already in the group
-        existing = db.query(models.GroupMember).filter_by(group_id=group_id, user_id=user.id).first()
-        if existing:
-            continue
+    # the first entry wins when the same email comes twice
+    requested = {}
+    for m in members.members:
+        requested.setdefault(m.email, m)
 
-        group_member = models.GroupMember(group_id=group_id, user_id=user.id)
-        db.add(group_member)
-        db.commit()
-        db.refresh(group_member)
-
-        added.append(
-            schemas.MemberAddedInfo(
-                id=group_member.id,
-                user_id=user.id,
-                name=user.name,
-                email=user.email
+    # Fetch the existing users, create the rest in one statement.
+    # ON CONFLICT covers a user created by another request in between, those are read back afterwards.
+    users = {
+        user.email: user for user in db.query(models.User.id, models.User.name, models.User.email)
+        .filter(models.User.email.in_(list(requested)))
+    }
+    missing = [{"id": uuid4(), "name": m.name, "email": m.email} for email, m in requested.items() if email not in users]
+    if missing:
+        stmt = (
+            dialect_insert(db, models.User)
+            .on_conflict_do_nothing(index_elements=["email"])
+            .returning(models.User.id, models.User.name, models.User.email)
+        )
+        users.update((user.email, user) for user in db.execute(stmt, missing))
+        raced = [row["email"] for row in missing if row["email"] not in users]
+        if raced:
+            users.update(
+                (user.email, user) for user in db.query(models.User.id, models.User.name, models.User.email)
+                .filter(models.User.email.in_(raced))
             )
+
+    # users already in the group are skipped by the unique (group_id, user_id) index
+    stmt = (
+        dialect_insert(db, models.GroupMember)
+        .on_conflict_do_nothing(index_elements=["group_id", "user_id"])
+        .returning(models.GroupMember.id, models.GroupMember.user_id)
+    )
+    inserted = {
+        row.user_id: row.id for row in db.execute(stmt, [
+            {"id": uuid4(), "group_id": group.id, "user_id": users[email].id}
+            for email in requested
+        ])
+    } if requested else {}
+    if inserted:
+        # a new member has no events yet, its snapshot starts at the group's current event id
+        last_event_id = ledger.last_event_id(db, group.id)
+        db.execute(insert(models.MemberBalance), [
+            {
+                "member_id": member_id,
+                "group_id": group.id,
+                "total_paid": 0,
+                "total_owed": 0,
+                "total_sent": 0,
+                "total_received": 0,
+                "last_event_id": last_event_id
+            }
+            for member_id in inserted.values()
+        ])
+    db.commit()
+    cache.invalidate(group.id, list(inserted))
+
+    added = [
+        schemas.MemberAddedInfo(
+            id=inserted[users[email].id],
+            user_id=users[email].id,
+            name=users[email].name,
+            email=users[email].email
         )
+        for email in requested if users[email].id in inserted
+    ]
 
     return schemas.MemberAddResponse(group_id=group.id, members_added=added)
 
@@ -88,6 +158,7 @@ def get_members_in_group(db: Session, group_id: str):
     members = (
         db.query(models.GroupMember)
         .join(models.User)
+        .options(contains_eager(models.GroupMember.user))
         .filter(models.GroupMember.group_id == group_id)
         .all()
     )
@@ -102,21 +173,84 @@ def get_members_in_group(db: Session, group_id: str):
         for member in members
     ]
 
+# this works out the split rows of an expense, amounts are rounded to cents the same way the column stores them.
+# compact holds the split_rule / split_members columns when the split goes on the expense row instead of the rows
+def build_splits(expense_id, data: schemas.ExpenseCreate) -> tuple:
+    if not data.split_details:
+        raise HTTPException(status_code=400, detail="split_details must not be empty")
+
+    # everything is worked out in integer cents, the shares always add up to the expense amount exactly
+    total = money.to_cents(data.amount)
+    percentages = [None] * len(data.split_details)
+    weights = None
+    shares = []
+    if data.split_type == "EQUAL":
+        shares = money.split_equal(total, len(data.split_details)).tolist()
+
+    elif data.split_type == "EXACT":
+        if any(d.amount is None for d in data.split_details):
+            raise HTTPException(status_code=400, detail="Every split needs an amount")
+        shares = [money.to_cents(d.amount) for d in data.split_details]
+        if sum(shares) != total:
+            raise HTTPException(status_code=400, detail="Split amounts do not match total")
+
+    elif data.split_type == "PERCENTAGE":
+        if any(d.percentage is None for d in data.split_details):
+            raise HTTPException(status_code=400, detail="Every split needs a percentage")
+        # a share outside 0..100 can't be a part of the amount, and wouldn't fit the packed 2 byte weight either
+        if any(not 0 <= d.percentage <= 100 for d in data.split_details):
+            raise HTTPException(status_code=400, detail="Split percentages must be between 0 and 100")
+        # split_details.percentage holds 2 decimals, a finer one would be rounded and could stop adding up to 100
+        if any(d.percentage != d.percentage.quantize(money.CENT) for d in data.split_details):
+            raise HTTPException(status_code=400, detail="Split percentages can have at most 2 decimal places")
+        weights = [money.percent_weight(d.percentage) for d in data.split_details]
+        if sum(weights) != money.FULL_PERCENT:
+            raise HTTPException(status_code=400, detail="Split percentages must total 100")
+        shares = money.split_percentage(total, weights).tolist()
+        percentages = [d.percentage for d in data.split_details]
+
+    rows = [
+        {
+            "id": uuid4(),
+            "expense_id": expense_id,
+            "member_id": detail.group_member_id,
+            "amount": money.from_cents(cents),
+            "percentage": percentage
+        }
+        for detail, cents, percentage in zip(data.split_details, shares, percentages)
+    ]
+    compact = {"split_rule": None, "split_members": None}
+    if config.COMPACT_SPLITS and data.split_type in splits.RULES:
+        compact = {
+            "split_rule": data.split_type,
+            "split_members": splits.pack([d.group_member_id for d in data.split_details], weights)
+        }
+    return rows, shares, compact
+
 # this handles the expense and split it among members:
 def create_expense(db: Session, group_id: str, data: schemas.ExpenseCreate):
-    # Validating the group
-    group = db.query(models.Group).filter_by(id=group_id).first()
+    # Validating the split amounts first, a bad split never touches the database
+    expense_id = uuid4()
+    rows, shares, compact = build_splits(expense_id, data)
+
+    # Validating the group, its row lock keeps the ledger events of the group in commit order
+    group = db.query(models.Group).filter_by(id=group_id).with_for_update(key_share=True).first()
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
     # Validating the payer in the group
-    payer = db.query(models.GroupMember).filter_by(id=data.paid_by, group_id=group_id).first()
+    payer = (
+        db.query(models.GroupMember)
+        .options(joinedload(models.GroupMember.user))
+        .filter_by(id=data.paid_by, group_id=group_id)
+        .first()
+    )
     if not payer:
         raise HTTPException(status_code=404, detail="Payer not found in group")
 
     # Validating the member amount which the amount will be splitted.
     member_ids = [d.group_member_id for d in data.split_details]
-    valid_members = db.query(models.GroupMember).filter(
+    valid_members = db.query(models.GroupMember).options(joinedload(models.GroupMember.user)).filter(
         models.GroupMember.group_id == group_id,
         models.GroupMember.id.in_(member_ids)
     ).all()
@@ -129,56 +263,29 @@ def create_expense(db: Session, group_id: str, data: schemas.ExpenseCreate):
 
     # putting the expens into the database.
     expense = models.Expense(
-        id=uuid4(),
+        id=expense_id,
         description=data.description,
-        amount=data.amount,
+        amount=money.from_cents(money.to_cents(data.amount)),
         paid_by=data.paid_by,
         group_id=group_id,
-        split_type=data.split_type
+        split_type=data.split_type,
+        **compact
     )
     db.add(expense)
-    db.commit()
-    db.refresh(expense)
+    db.flush()
 
-    # Create splits
-    splits = []
-    if data.split_type == "EQUAL":
-        per_head = data.amount / len(data.split_details)
-        for detail in data.split_details:
-            splits.append(models.SplitDetail(
-                id=uuid4(),
-                expense_id=expense.id,
-                member_id=detail.group_member_id,
-                amount=per_head
-            ))
+    # Create splits, a compact split has them on the expense row already
+    if not compact["split_rule"]:
+        db.add_all([models.SplitDetail(**row, group_id=group.id) for row in rows])
 
-    elif data.split_type == "EXACT":
-        total = sum(d.amount for d in data.split_details)
-        if total != data.amount:
-            raise HTTPException(status_code=400, detail="Split amounts do not match total")
-        for detail in data.split_details:
-            splits.append(models.SplitDetail(
-                id=uuid4(),
-                expense_id=expense.id,
-                member_id=detail.group_member_id,
-                amount=detail.amount
-            ))
+    # recording the ledger events in the same transaction as the expense
+    ledger.append_events(db, group.id, [("expense", expense.id, payer.id, {"total_paid": money.to_cents(data.amount)})] + [
+        ("split", expense.id, row["member_id"], {"total_owed": cents}) for row, cents in zip(rows, shares)
+    ])
+    apply_rollup_deltas(db, group.id, {expense.created_at.date(): [money.to_cents(data.amount), 1]})
 
-    elif data.split_type == "PERCENTAGE":
-        total = sum(d.percentage for d in data.split_details)
-        if total != 100:
-            raise HTTPException(status_code=400, detail="Split percentages must total 100")
-        for detail in data.split_details:
-            splits.append(models.SplitDetail(
-                id=uuid4(),
-                expense_id=expense.id,
-                member_id=detail.group_member_id,
-                amount=(data.amount * detail.percentage / 100),
-                percentage=detail.percentage
-            ))
-
-    db.add_all(splits)
     db.commit()
+    cache.invalidate(group.id)
 
     return schemas.ExpenseResponse(
         id=expense.id,
@@ -190,15 +297,202 @@ def create_expense(db: Session, group_id: str, data: schemas.ExpenseCreate):
         },
         split_details=[
             {
-                "member_id": s.member_id,
-                "member_name": member_map.get(s.member_id),
-                "amount": s.amount
-            } for s in splits
+                "member_id": row["member_id"],
+                "member_name": member_map.get(row["member_id"]),
+                "amount": row["amount"]
+            } for row in rows
         ]
     )
 
+# this imports many expenses in one transaction. rows is an iterable of (row_number, dict), a parse error can be
+# passed in place of the dict. bad rows are reported back and skipped, the rest is inserted in chunks.
+# rows is read from the request body as it streams in, so the group row is only locked at the end, for the
+# ledger events and rollups: a slow upload doesn't hold up the other writes to the group meanwhile
+def bulk_create_expenses(db: Session, group_id: str, rows, chunk_size: int = 1000) -> schemas.BulkExpenseResponse:
+    group = db.query(models.Group.id).filter_by(id=group_id).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    # every row is validated against this one set instead of querying the members again
+    member_ids = {member_id for (member_id,) in db.query(models.GroupMember.id).filter_by(group_id=group_id)}
+
+    events = []
+    day_deltas = defaultdict(lambda: [0, 0])
+    errors = []
+    inserted = 0
+    expense_rows, split_rows = [], []
+
+    def flush_chunk():
+        if expense_rows:
+            # render_nulls keeps the rows with and without a compact split in one executemany
+            db.execute(insert(models.Expense).execution_options(render_nulls=True), expense_rows)
+            if split_rows:
+                db.execute(insert(models.SplitDetail), split_rows)
+            expense_rows.clear()
+            split_rows.clear()
+
+    for row_number, raw in rows:
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            data = schemas.ExpenseCreate.model_validate(raw)
+            if data.paid_by not in member_ids:
+                raise ValueError("Payer not found in group")
+            if any(d.group_member_id not in member_ids for d in data.split_details):
+                raise ValueError("One or more group_member_ids are invalid or not in the group")
+            expense_id = uuid4()
+            expense_splits, shares, compact = build_splits(expense_id, data)
+            total = money.to_cents(data.amount)
+            created_at = datetime.utcnow()
+        except ValidationError as e:
+            errors.append(schemas.BulkExpenseError(
+                row=row_number,
+                error="; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            ))
+            continue
+        except HTTPException as e:
+            errors.append(schemas.BulkExpenseError(row=row_number, error=str(e.detail)))
+            continue
+        except ValueError as e:
+            errors.append(schemas.BulkExpenseError(row=row_number, error=str(e)))
+            continue
+
+        expense_rows.append({
+            "id": expense_id,
+            "description": data.description,
+            "amount": money.from_cents(total),
+            "paid_by": data.paid_by,
+            "group_id": group.id,
+            "split_type": data.split_type,
+            "created_at": created_at,
+            **compact
+        })
+        if not compact["split_rule"]:
+            split_rows.extend({**split, "group_id": group.id} for split in expense_splits)
+        events.append(("expense", expense_id, data.paid_by, {"total_paid": total}))
+        events.extend(
+            ("split", expense_id, split["member_id"], {"total_owed": cents})
+            for split, cents in zip(expense_splits, shares)
+        )
+        day_deltas[created_at.date()][0] += total
+        day_deltas[created_at.date()][1] += 1
+        inserted += 1
+
+        if len(expense_rows) >= chunk_size:
+            flush_chunk()
+
+    flush_chunk()
+    # the group row lock keeps the ledger events of the group in commit order, like every other write
+    db.query(models.Group.id).filter_by(id=group.id).with_for_update(key_share=True).first()
+    # a big import always leaves a long tail, so it is folded into the snapshot right away
+    ledger.append_events(db, group.id, events, snapshot_every=0)
+    apply_rollup_deltas(db, group.id, day_deltas)
+    db.commit()
+    cache.invalidate(group.id)
+
+    return schemas.BulkExpenseResponse(
+        group_id=group.id,
+        inserted=inserted,
+        failed=len(errors),
+        errors=errors
+    )
+
+# the listing cursor is the (created_at, id) of the last expense on the page, opaque to the client
+def encode_cursor(created_at: datetime, expense_id) -> str:
+    raw = json.dumps([created_at.isoformat(), str(expense_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, expense_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), UUID(expense_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# this lists the expenses of a group newest first, one page at a time.
+# paging is keyset on (created_at, id), so a deep page costs the same index range scan as the first one.
+def list_expenses(
+    db: Session,
+    group_id: str,
+    cursor: str = None,
+    limit: int = 50,
+    paid_by=None,
+    member_id=None,
+    created_from: datetime = None,
+    created_to: datetime = None,
+    min_amount=None,
+    max_amount=None,
+    include_splits: bool = False
+) -> schemas.ExpenseListResponse:
+    group = db.query(models.Group.id).filter_by(id=group_id).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    query = db.query(models.Expense).filter(models.Expense.group_id == group.id)
+    if paid_by:
+        query = query.filter(models.Expense.paid_by == paid_by)
+    if member_id:
+        query = query.filter(or_(
+            db.query(models.SplitDetail.id)
+            .filter(
+                models.SplitDetail.group_id == group.id,
+                models.SplitDetail.expense_id == models.Expense.id,
+                models.SplitDetail.member_id == member_id
+            )
+            .exists(),
+            splits.has_member(models.Expense.split_members, member_id)
+        ))
+    if created_from:
+        query = query.filter(models.Expense.created_at >= created_from)
+    if created_to:
+        query = query.filter(models.Expense.created_at < created_to)
+    if min_amount is not None:
+        query = query.filter(models.Expense.amount >= min_amount)
+    if max_amount is not None:
+        query = query.filter(models.Expense.amount <= max_amount)
+    if cursor:
+        query = query.filter(tuple_(models.Expense.created_at, models.Expense.id) < decode_cursor(cursor))
+    if include_splits:
+        # one extra SELECT ... WHERE expense_id IN (...) for the whole page, within the group's partition
+        query = query.options(selectinload(models.Expense.splits.and_(models.SplitDetail.group_id == group.id)))
+
+    # one row more than asked tells whether there is a next page
+    expenses = query.order_by(models.Expense.created_at.desc(), models.Expense.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(expenses) > limit:
+        expenses = expenses[:limit]
+        next_cursor = encode_cursor(expenses[-1].created_at, expenses[-1].id)
+
+    return schemas.ExpenseListResponse(
+        group_id=group.id,
+        expenses=[
+            schemas.ExpenseListItem(
+                id=e.id,
+                description=e.description,
+                amount=e.amount,
+                paid_by=e.paid_by,
+                split_type=e.split_type,
+                created_at=e.created_at,
+                split_details=[
+                    schemas.ExpenseSplitItem(member_id=split_member_id, amount=amount, percentage=percentage)
+                    for split_member_id, amount, percentage in splits.expense_splits(e)
+                ] if include_splits else None
+            )
+            for e in expenses
+        ],
+        next_cursor=next_cursor
+    )
+
 # this fetches the groups expenses and uses the debt simplfication methods.
-def get_group_balance(db: Session, group_id: str):
+# like the other read endpoints it returns the final values (ids, Decimals, floats), routes.py encodes them as they are
+def get_group_balance(db: Session, group_id: str, strategy: str = "exact") -> dict:
+    balance = read_group_balance(db, group_id)
+    return group_balance_payload(balance, settlement.simplify(balance["nets"], strategy))
+
+# this reads the nets of the group's members without simplifying them. the exact simplification is CPU bound
+# and with DB_ASYNC the crud functions run on the event loop thread, so the route works out the transfers in an
+# executor and builds the response with group_balance_payload
+def read_group_balance(db: Session, group_id: str) -> dict:
     group = db.query(models.Group).filter_by(id=group_id).first()
     if not group:
         error_response(
@@ -210,102 +504,155 @@ def get_group_balance(db: Session, group_id: str):
             status_code=404
         )
 
-    members = db.query(models.GroupMember).filter_by(group_id=group_id).all()
-
-
-    member_map = {m.id: m.user.name for m in members}
-   # this will return all the expenses by the group_id, this will return list of expenses
-    expenses = db.query(models.Expense).filter_by(group_id=group_id).all()
-
-    splits = (
-        db.query(models.SplitDetail)
-        .join(models.Expense)
-        .filter(models.Expense.group_id == group_id)
+    # one row per member, the latest snapshot plus the short tail of events after it, no history rescan.
+    # the database hands the totals back in cents, so the netting below is one vectorized pass
+    tail, totals = ledger.group_totals(group.id)
+    rows = (
+        db.query(models.GroupMember.id, models.User.name, *totals)
+        .join(models.User, models.GroupMember.user_id == models.User.id)
+        .outerjoin(models.MemberBalance, models.MemberBalance.member_id == models.GroupMember.id)
+        .outerjoin(tail, tail.c.member_id == models.GroupMember.id)
+        .filter(models.GroupMember.group_id == group.id)
         .all()
     )
 
-    # Track totals
-    paid = defaultdict(float)
-    owed = defaultdict(float)
+    nets = money.net_balances([row[2:] for row in rows]).tolist()
+    return {
+        "group_id": group.id,
+        "group_name": group.name,
+        "rows": rows,
+        "nets": {row[0]: net for row, net in zip(rows, nets)}
+    }
 
-    for expense in expenses:
-        paid[expense.paid_by] += float(expense.amount)
+# this is the balance response from read_group_balance and the transfers of the group. nets keeps the member rows'
+# order, so its values line up with them
+def group_balance_payload(balance: dict, transfers: list) -> dict:
+    return balance_payload(
+        balance["group_id"], balance["group_name"], balance["rows"], list(balance["nets"].values()), transfers
+    )
 
-    for split in splits:
-        owed[split.member_id] += float(split.amount)
+# this builds the balance response of one group from its member rows (member_id, name, paid, owed, sent, received),
+# their nets and the simplified transfers, everything in cents
+def balance_payload(group_id, group_name: str, rows: list, nets: list, transfers: list) -> dict:
+    member_map = {row[0]: row[1] for row in rows}
 
     # Member summaries
-    member_summaries = []
-    for member in members:
-        total_paid = paid[member.id]
-        total_owed = owed[member.id]
-        balance = total_paid - total_owed
-        member_summaries.append({
-            "member_id": str(member.id),
-            "name": member.user.name,
-            "total_paid": round(total_paid, 2),
-            "total_owed": round(total_owed, 2),
-            "balance": round(balance, 2)
-        })
+    member_summaries = [
+        {
+            "member_id": member_id,
+            "name": name,
+            "total_paid": money.from_cents(paid),
+            "total_owed": money.from_cents(owed),
+            "balance": money.from_cents(net)
+        }
+        for (member_id, name, paid, owed, _, _), net in zip(rows, nets)
+    ]
 
-    # Simplified balances
-    net_balances = {m["member_id"]: m["balance"] for m in member_summaries}
-    debtors = {k: v for k, v in net_balances.items() if v < 0}
-    creditors = {k: v for k, v in net_balances.items() if v > 0}
-
-
-    # this is core-debt simplification algorithm
-    balances = []
-    for debtor_id, debt in debtors.items():
-        for creditor_id, credit in creditors.items():
-            if debt == 0:
-                break
-            transfer = min(-debt, credit)
-            if transfer > 0:
-                balances.append({
-                    "from": {
-                        "id": debtor_id,
-                        "name": member_map[UUID(debtor_id)]
-                    },
-                    "to": {
-                        "id": creditor_id,
-                        "name": member_map[UUID(creditor_id)]
-                    },
-                    "amount": round(transfer, 2)
-                })
-                net_balances[debtor_id] += transfer
-                net_balances[creditor_id] -= transfer
-                debtors[debtor_id] += transfer
-                creditors[creditor_id] -= transfer
+    # the transfers of the core-debt simplification, done in integer cents by the settlement engine
+    balances = [
+        {
+            "from": {
+                "id": debtor_id,
+                "name": member_map[debtor_id]
+            },
+            "to": {
+                "id": creditor_id,
+                "name": member_map[creditor_id]
+            },
+            "amount": money.to_units(cents)
+        }
+        for debtor_id, creditor_id, cents in transfers
+    ]
 
     return {
-        "group_id": str(group.id),
-        "group_name": group.name,
+        "group_id": group_id,
+        "group_name": group_name,
         "balances": balances,
         "member_summaries": member_summaries
     }
 
+# this reads the balance of many groups in one go, for dashboards. the groups come from one query and the current
+# totals of all their members from another, snapshot plus the tail of every group, netted in one vectorized pass.
+# the debts aren't simplified here: with DB_ASYNC this runs on the event loop thread, so the route hands "nets"
+# to settlement.simplify_many in an executor and builds the response with group_balances_payload.
+# the ids that aren't a group are listed in not_found
+def get_group_balances(db: Session, group_ids: list) -> dict:
+    group_ids = list(dict.fromkeys(group_ids))
+    if not group_ids:
+        raise HTTPException(status_code=400, detail="group_ids must not be empty")
+    if len(group_ids) > config.BATCH_BALANCE_MAX_GROUPS:
+        raise HTTPException(status_code=400, detail=f"At most {config.BATCH_BALANCE_MAX_GROUPS} groups per request")
+
+    groups = dict(db.query(models.Group.id, models.Group.name).filter(models.Group.id.in_(group_ids)).all())
+    found = [group_id for group_id in group_ids if group_id in groups]
+
+    rows = []
+    if found:
+        tail, totals = ledger.groups_totals(db, found)
+        rows = (
+            db.query(models.GroupMember.group_id, models.GroupMember.id, models.User.name, *totals)
+            .join(models.User, models.GroupMember.user_id == models.User.id)
+            .outerjoin(models.MemberBalance, models.MemberBalance.member_id == models.GroupMember.id)
+            .outerjoin(tail, tail.c.member_id == models.GroupMember.id)
+            .filter(models.GroupMember.group_id.in_(found))
+            .all()
+        )
+    nets = money.net_balances([row[3:] for row in rows]).tolist()
+
+    members = {group_id: ([], []) for group_id in found}
+    for (group_id, *row), net in zip(rows, nets):
+        members[group_id][0].append(row)
+        members[group_id][1].append(net)
+
+    return {
+        "groups": {group_id: (groups[group_id], *members[group_id]) for group_id in found},
+        "nets": {group_id: {row[0]: net for row, net in zip(*members[group_id])} for group_id in found},
+        "not_found": [group_id for group_id in group_ids if group_id not in groups]
+    }
+
+# this is the batch balance response, keyed by group id, from get_group_balances and the transfers of every group
+def group_balances_payload(balances: dict, transfers: dict) -> dict:
+    return {
+        "balances": {
+            str(group_id): balance_payload(group_id, group_name, rows, nets, transfers[group_id])
+            for group_id, (group_name, rows, nets) in balances["groups"].items()
+        },
+        "not_found": balances["not_found"]
+    }
+
 # this keeps the records of settlement of the amount between the members of the group
 def record_settlement(db: Session, group_id: str, data: schemas.SettlementCreate) -> schemas.SettlementResponse:
-    group = db.query(models.Group).filter_by(id=group_id).first()
+    # a settlement pays a positive amount to someone else. a negative one would grow the payer's debt instead,
+    # past the over-settle check below, so both are turned away before the lock
+    if money.to_cents(data.amount) <= 0:
+        raise HTTPException(status_code=400, detail="Settlement amount must be positive")
+    if data.from_group_member_id == data.to_group_member_id:
+        raise HTTPException(status_code=400, detail="A member can't settle with themselves")
+
+    group = db.query(models.Group).filter_by(id=group_id).with_for_update(key_share=True).first()
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
-    from_member = db.query(models.GroupMember).filter_by(id=data.from_group_member_id, group_id=group_id).first()
-    to_member = db.query(models.GroupMember).filter_by(id=data.to_group_member_id, group_id=group_id).first()
+    # both members and their users in one statement
+    members = {
+        member.id: member for member in db.query(models.GroupMember)
+        .options(joinedload(models.GroupMember.user))
+        .filter(
+            models.GroupMember.group_id == group_id,
+            models.GroupMember.id.in_([data.from_group_member_id, data.to_group_member_id])
+        )
+    }
+    from_member = members.get(data.from_group_member_id)
+    to_member = members.get(data.to_group_member_id)
 
     if not from_member or not to_member:
         raise HTTPException(status_code=404, detail="Both members must exist in the group")
 
-    # fetching the amount and then validating if amount is not more than the settlement amount
-
-    group_balance = get_group_balance(db, group_id)
-    from_summary = next((m for m in group_balance["member_summaries"] if m["member_id"] == str(from_member.id)), None)
-
-    if not from_summary:
-        raise HTTPException(status_code=400, detail="Could not retrieve balance for payer")
+    # fetching the payer's balance (its snapshot row plus its own tail) and then validating
+    # if amount is not more than what the payer still owes. the group row lock above makes this
+    # check and the insert below one step, two settle-ups can't both pass on the same balance
 
-    max_settle_amount = abs(from_summary["balance"])
+    max_settle_amount = money.from_cents(max(-ledger.member_cents(db, from_member.id), 0))
     if data.amount > max_settle_amount:
         raise HTTPException(
             status_code=400,
@@ -318,11 +665,16 @@ def record_settlement(db: Session, group_id: str, data: schemas.SettlementCreate
         group_id=group_id,
         from_member_id=data.from_group_member_id,
         to_member_id=data.to_group_member_id,
-        amount=data.amount
+        amount=money.from_cents(money.to_cents(data.amount))
     )
     db.add(settlement)
+    db.flush()
+    ledger.append_events(db, group.id, [
+        ("settlement", settlement.id, from_member.id, {"total_sent": money.to_cents(data.amount)}),
+        ("settlement", settlement.id, to_member.id, {"total_received": money.to_cents(data.amount)})
+    ])
     db.commit()
-    db.refresh(settlement)
+    cache.invalidate(group.id)
 
     return schemas.SettlementResponse(
         id=settlement.id,
@@ -339,98 +691,248 @@ def record_settlement(db: Session, group_id: str, data: schemas.SettlementCreate
     )
 
 # this gives a user summary that how many group he/she is in and how much he/she owes.
-def get_member_summary(db: Session, user_id: str):
+def get_member_summary(db: Session, user_id: str) -> dict:
     user = db.query(models.User).filter_by(id=user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    memberships = db.query(models.GroupMember).filter_by(user_id=user_id).all()
+    # one query for every group of the user, reading only this user's snapshots and tails in cents
+    tail, totals = ledger.current_totals(
+        models.LedgerEvent.member_id.in_(db.query(models.GroupMember.id).filter(models.GroupMember.user_id == user.id).scalar_subquery())
+    )
+    memberships = (
+        db.query(models.Group.id, models.Group.name, *totals)
+        .join(models.GroupMember, models.GroupMember.group_id == models.Group.id)
+        .outerjoin(models.MemberBalance, models.MemberBalance.member_id == models.GroupMember.id)
+        .outerjoin(tail, tail.c.member_id == models.GroupMember.id)
+        .filter(models.GroupMember.user_id == user.id)
+        .all()
+    )
+    balances = money.net_balances([row[2:] for row in memberships]).tolist()
 
     group_summaries = []
-    overall_balance = 0.0
-
-    for membership in memberships:
-        group = db.query(models.Group).filter_by(id=membership.group_id).first()
-        expenses = db.query(models.Expense).filter_by(group_id=group.id).all()
-        splits = db.query(models.SplitDetail).join(models.Expense).filter(models.Expense.group_id == group.id).all()
-
-        total_paid = sum(float(e.amount) for e in expenses if e.paid_by == membership.id)
-        total_owed = sum(float(s.amount) for s in splits if s.member_id == membership.id)
-        balance = round(total_paid - total_owed, 2)
-        overall_balance += balance
-
+    for (group_id, group_name, *_), balance in zip(memberships, balances):
         group_summaries.append({
-            "group_id": str(group.id),
-            "group_name": group.name,
-            "balance": balance,
+            "group_id": group_id,
+            "group_name": group_name,
+            "balance": money.from_cents(balance),
             "status": "gets_back" if balance > 0 else "owes" if balance < 0 else "settled"
         })
 
     return {
-        "member_id": str(user.id),
+        "member_id": user.id,
         "name": user.name,
-        "overall_balance": round(overall_balance, 2),
+        "overall_balance": money.from_cents(sum(balances)),
         "groups": group_summaries
     }
 
+# this works out how the user settles up over all their groups, with one transfer per counterpart. every group
+# is settled on its own: its nets (snapshot plus ledger tail, the numbers /balance and the settle check use) are
+# simplified the way /balance does it, and the transfers the user takes part in are kept. those are summed per
+# counterpart, a debt in one group offsetting a credit in another, and every group entry names the members to
+# record it with in POST /groups/{group_id}/settle. the user's transfers in a group add up to their net there,
+# so the plan's net_balance is the summary's overall_balance.
+def get_settle_plan(db: Session, user_id: str, strategy: str = "exact") -> dict:
+    plan = read_settle_plan(db, user_id)
+    return settle_plan_payload(plan, settlement.simplify_many(plan["nets"], strategy))
+
+# this reads what the settle plan is worked out from, the nets of every member of the user's groups. like the
+# balance endpoints it doesn't simplify them, the route does that in an executor, off the event loop
+def read_settle_plan(db: Session, user_id: str) -> dict:
+    user = db.query(models.User).filter_by(id=user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    group_ids = list(dict.fromkeys(
+        group_id for (group_id,) in db.query(models.GroupMember.group_id).filter(models.GroupMember.user_id == user.id)
+    ))
+    rows = []
+    if group_ids:
+        tail, totals = ledger.groups_totals(db, group_ids)
+        rows = (
+            db.query(
+                models.GroupMember.group_id, models.Group.name, models.GroupMember.id, models.GroupMember.user_id,
+                models.User.name, *totals
+            )
+            .join(models.Group, models.Group.id == models.GroupMember.group_id)
+            .join(models.User, models.User.id == models.GroupMember.user_id)
+            .outerjoin(models.MemberBalance, models.MemberBalance.member_id == models.GroupMember.id)
+            .outerjoin(tail, tail.c.member_id == models.GroupMember.id)
+            .filter(models.GroupMember.group_id.in_(group_ids))
+            # the same order for every user of a group, so their plans pick the same transfers where amounts tie
+            .order_by(models.GroupMember.group_id, models.GroupMember.id)
+            .all()
+        )
+    nets = money.net_balances([row[5:] for row in rows]).tolist()
+
+    group_names, members = {}, {}
+    by_group = {group_id: {} for group_id in group_ids}
+    for (group_id, group_name, member_id, member_user_id, user_name, *_), net in zip(rows, nets):
+        group_names[group_id] = group_name
+        members[member_id] = (member_user_id, user_name)
+        by_group[group_id][member_id] = net
+
+    return {
+        "user_id": user.id,
+        "name": user.name,
+        "group_ids": group_ids,
+        "group_names": group_names,
+        "members": members,
+        "nets": by_group
+    }
+
+# this is the settle plan response from read_settle_plan and the simplified transfers of every group
+def settle_plan_payload(plan: dict, transfers: dict) -> dict:
+    me, members = plan["user_id"], plan["members"]
+    counterparts = {}
+    for group_id in plan["group_ids"]:
+        for from_id, to_id, cents in transfers[group_id]:
+            (from_user, from_name), (to_user, to_name) = members[from_id], members[to_id]
+            if (from_user == me) == (to_user == me):
+                continue
+            # positive when the counterpart pays the user
+            counterpart_id, name, cents = (to_user, to_name, -cents) if from_user == me else (from_user, from_name, cents)
+            entry = counterparts.setdefault(counterpart_id, {"name": name, "cents": 0, "groups": []})
+            entry["cents"] += cents
+            entry["groups"].append((group_id, cents, from_id, to_id))
+
+    user = {"id": me, "name": plan["name"]}
+    plan_transfers = []
+    # a counterpart whose groups offset each other exactly still gets a transfer of 0, its groups need recording
+    for counterpart_id, entry in counterparts.items():
+        them = {"id": counterpart_id, "name": entry["name"]}
+        sign = 1 if entry["cents"] >= 0 else -1
+        plan_transfers.append({
+            "from_": them if sign > 0 else user,
+            "to": user if sign > 0 else them,
+            "amount": money.from_cents(abs(entry["cents"])),
+            "groups": [
+                {
+                    "group_id": group_id,
+                    "group_name": plan["group_names"][group_id],
+                    "amount": money.from_cents(cents * sign),
+                    "from_member_id": from_id,
+                    "to_member_id": to_id
+                }
+                for group_id, cents, from_id, to_id in sorted(entry["groups"], key=lambda g: -g[1] * sign)
+            ]
+        })
+    plan_transfers.sort(key=lambda transfer: -transfer["amount"])
+
+    return {
+        "user_id": me,
+        "name": plan["name"],
+        "net_balance": money.from_cents(sum(entry["cents"] for entry in counterparts.values())),
+        "transfers": plan_transfers,
+        "group_ids": plan["group_ids"]
+    }
+
 # this just delete an expense using the expense id
 def delete_expense(db: Session, group_id: str, expense_id: str):
-    expense = db.query(models.Expense).filter_by(id=expense_id, group_id=group_id).first()
+    group = db.query(models.Group.id).filter_by(id=group_id).with_for_update(key_share=True).first()
+    expense = db.query(models.Expense).filter_by(id=expense_id, group_id=group_id).first() if group else None
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found in group")
 
-    # Delete associated split details first
-    db.query(models.SplitDetail).filter_by(expense_id=expense_id).delete()
+    # reversing the running totals with deletion events before the rows go away
+    events = [("expense_deleted", expense.id, expense.paid_by, {"total_paid": -money.to_cents(expense.amount)})]
+    if expense.split_rule:
+        for member_id, cents, _ in splits.shares(expense.split_rule, expense.split_members, money.to_cents(expense.amount)):
+            events.append(("split_deleted", expense.id, member_id, {"total_owed": -cents}))
+    else:
+        split_rows = db.query(models.SplitDetail.member_id, models.SplitDetail.amount).filter_by(
+            group_id=group.id, expense_id=expense.id
+        )
+        for member_id, amount in split_rows:
+            events.append(("split_deleted", expense.id, member_id, {"total_owed": -money.to_cents(amount or 0)}))
 
-    # Delete the expense
-    db.delete(expense)
+        # Delete associated split details first
+        db.query(models.SplitDetail).filter_by(group_id=group.id, expense_id=expense.id).delete()
+
+    # Delete the expense, with a plain DELETE: the session would load expense.splits first to detach them
+    db.query(models.Expense).filter_by(group_id=group.id, id=expense.id).delete()
+    ledger.append_events(db, group.id, events)
+    apply_rollup_deltas(db, expense.group_id, {expense.created_at.date(): [-money.to_cents(expense.amount), -1]})
     db.commit()
+    cache.invalidate(group_id)
 
     return {"message": "Expense deleted successfully"}
 
 # this give info about the group, payment timing, amount, transaction...
-def get_group_analytics(db: Session, group_id: str) -> dict:
-    expenses = db.query(models.Expense).filter_by(group_id=group_id).all()
-    splits = (
-        db.query(models.SplitDetail)
-        .join(models.Expense)
-        .filter(models.Expense.group_id == group_id)
+def get_group_analytics(db: Session, group_id: str, granularity: str = "day", start_date: date = None, end_date: date = None) -> dict:
+    group = db.query(models.Group.id).filter_by(id=group_id).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+
+    # Member summaries, read from the ledger snapshots and tails in cents
+    tail, totals = ledger.group_totals(group.id)
+    # the net counts the settlements too, netted the same way as the balance endpoint
+    members = (
+        db.query(models.User.name, *totals)
+        .join(models.GroupMember, models.GroupMember.user_id == models.User.id)
+        .outerjoin(models.MemberBalance, models.MemberBalance.member_id == models.GroupMember.id)
+        .outerjoin(tail, tail.c.member_id == models.GroupMember.id)
+        .filter(models.GroupMember.group_id == group.id)
         .all()
     )
+    nets = money.net_balances([row[1:] for row in members]).tolist()
+    summaries = [
+        {
+            "name": name,
+            "total_paid": money.to_units(total_paid),
+            "total_owed": money.to_units(total_owed),
+            "net_balance": money.to_units(net)
+        }
+        for (name, total_paid, total_owed, *_), net in zip(members, nets)
+    ]
 
-    # Totals
-    paid = defaultdict(float)
-    owed = defaultdict(float)
-
-    for e in expenses:
-        paid[e.paid_by] += float(e.amount)
+    # Timeline from the daily rollups, one row per day in the range whatever the number of expenses.
+    # the running total starts from everything recorded before the range
+    rollup = models.DailyGroupRollup
+    cumulative = 0
+    if start_date:
+        before = (
+            db.query(func.sum(rollup.total_amount))
+            .filter(rollup.group_id == group.id, rollup.day < start_date)
+            .scalar()
+        )
+        cumulative = money.to_cents(before or 0)
 
-    for s in splits:
-        owed[s.member_id] += float(s.amount)
+    days = db.query(rollup.day, rollup.total_amount, rollup.expense_count).filter(rollup.group_id == group.id)
+    if start_date:
+        days = days.filter(rollup.day >= start_date)
+    if end_date:
+        days = days.filter(rollup.day <= end_date)
 
-    # Member summaries
-    members = db.query(models.GroupMember).filter_by(group_id=group_id).all()
-    summaries = []
-    for m in members:
-        summaries.append({
-            "name": m.user.name,
-            "total_paid": round(paid[m.id], 2),
-            "total_owed": round(owed[m.id], 2),
-            "net_balance": round(paid[m.id] - owed[m.id], 2)
-        })
+    buckets = {}
+    for day, amount, count in days.order_by(rollup.day):
+        if not count:
+            continue
+        bucket = buckets.setdefault(bucket_start(day, granularity), [0, 0])
+        bucket[0] += money.to_cents(amount)
+        bucket[1] += count
 
-    # Timeline
-    timeline_raw = sorted([(e.created_at.date(), float(e.amount)) for e in expenses])
     timeline = []
-    cumulative = 0.0
-    for dt, amt in timeline_raw:
-        cumulative += amt
+    for bucket, (amount, count) in buckets.items():
+        cumulative += amount
         timeline.append({
-            "date": dt.isoformat(),
-            "cumulative_amount": round(cumulative, 2)
+            "date": str(bucket),
+            "amount": money.to_units(amount),
+            "expense_count": count,
+            "cumulative_amount": money.to_units(cumulative)
         })
 
     return {
         "members": summaries,
         "timeline": timeline
     }
+
+# this gives the first day of the day / week (monday) / month bucket a day falls in
+def bucket_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
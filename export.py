@@ -0,0 +1,188 @@
+import csv
+import io
+import json
+from fastapi import HTTPException
+from sqlalchemy import literal, null, select
+from sqlalchemy.orm import Session
+import models
+import money
+import splits
+from database import ReadSessionLocal
+
+# -> streaming export of a group's full history (expenses, splits and settlements) as one flat table.
+# -> rows come off a server-side cursor in batches of BATCH_SIZE and every batch is encoded and yielded
+# -> before the next one is fetched, so memory stays flat however big the group is.
+
+BATCH_SIZE = 5000
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+COLUMNS = (
+    "record_type", "id", "expense_id", "created_at", "description", "split_type",
+    "amount", "percentage", "paid_by", "member_id", "from_member_id", "to_member_id"
+)
+
+
+# this checks the group before the response starts, a 404 can't be sent once the body is streaming
+def ensure_group(db: Session, group_id: str):
+    if not db.query(models.Group.id).filter_by(id=group_id).first():
+        raise HTTPException(status_code=404, detail="Group not found")
+
+
+# the three record types, each selected with the full set of COLUMNS so they can share one table, as
+# (statement, convert). the compact splits come out of their expense rows and convert turns them into split records
+def _statements(group_id: str) -> list:
+    e, s, t = models.Expense, models.SplitDetail, models.Settlement
+    return [
+        (select(
+            literal("expense").label("record_type"), e.id, null().label("expense_id"), e.created_at, e.description,
+            e.split_type, e.amount, null().label("percentage"), e.paid_by, null().label("member_id"),
+            null().label("from_member_id"), null().label("to_member_id")
+        ).where(e.group_id == group_id).order_by(e.created_at, e.id), None),
+        (select(
+            literal("split").label("record_type"), s.id, s.expense_id, null().label("created_at"), null().label("description"),
+            null().label("split_type"), s.amount, s.percentage, null().label("paid_by"), s.member_id,
+            null().label("from_member_id"), null().label("to_member_id")
+        ).where(s.group_id == group_id).order_by(s.expense_id, s.id), None),
+        (select(e.id, e.amount, e.split_rule, e.split_members).where(
+            e.group_id == group_id, e.split_rule.isnot(None)
+        ).order_by(e.id), _compact_splits),
+        (select(
+            literal("settlement").label("record_type"), t.id, null().label("expense_id"), t.settled_at.label("created_at"),
+            null().label("description"), null().label("split_type"), t.amount, null().label("percentage"),
+            null().label("paid_by"), null().label("member_id"), t.from_member_id, t.to_member_id
+        ).where(t.group_id == group_id).order_by(t.settled_at, t.id), None),
+    ]
+
+
+# this yields the export rows in batches. it opens its own session, the request's one is closed
+# by the time StreamingResponse iterates, and yield_per makes psycopg2 use a named server-side cursor.
+def iter_batches(group_id: str, batch_size: int = BATCH_SIZE):
+    db = ReadSessionLocal()
+    try:
+        for stmt, convert in _statements(group_id):
+            result = db.execute(stmt, execution_options={"yield_per": batch_size})
+            for batch in result.partitions():
+                yield convert(batch) if convert else batch
+    finally:
+        db.close()
+
+
+# a derived split has no id of its own, otherwise it looks like the split record its row would have given
+def _compact_splits(batch) -> list:
+    return [
+        ("split", None, expense_id, None, None, None, money.from_cents(cents), percentage, None, member_id, None, None)
+        for expense_id, amount, rule, packed in batch
+        for member_id, cents, percentage in splits.shares(rule, packed, money.to_cents(amount))
+    ]
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def stream_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for batch in batches:
+        writer.writerows([_text(v) for v in row] for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # a group without any rows still gets its header line
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_ndjson(batches):
+    for batch in batches:
+        yield "".join(
+            json.dumps({col: (_text(v) if v is not None else None) for col, v in zip(COLUMNS, row)}) + "\n"
+            for row in batch
+        ).encode("utf-8")
+
+
+# pyarrow asks the sink for its position to build the file footer, so it counts bytes
+# instead of relying on a buffer that gets emptied after every row group
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+# one parquet row group per batch. pyarrow is optional, it is only imported when parquet is asked for
+def stream_parquet(batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("record_type", pa.string()),
+        ("id", pa.string()),
+        ("expense_id", pa.string()),
+        ("created_at", pa.timestamp("us")),
+        ("description", pa.string()),
+        ("split_type", pa.string()),
+        ("amount", pa.decimal128(10, 2)),
+        ("percentage", pa.decimal128(5, 2)),
+        ("paid_by", pa.string()),
+        ("member_id", pa.string()),
+        ("from_member_id", pa.string()),
+        ("to_member_id", pa.string()),
+    ])
+    uuid_columns = {"id", "expense_id", "paid_by", "member_id", "from_member_id", "to_member_id"}
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    try:
+        for batch in batches:
+            columns = {
+                col: [str(v) if v is not None else None for v in values] if col in uuid_columns else list(values)
+                for col, values in zip(COLUMNS, zip(*batch))
+            }
+            writer.write_table(pa.table(columns, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+ENCODERS = {
+    "csv": stream_csv,
+    "ndjson": stream_ndjson,
+    "parquet": stream_parquet,
+}
+
+
+# this gives the body iterator for the StreamingResponse
+def stream(group_id: str, fmt: str):
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export needs pyarrow, install the parquet extra")
+    return ENCODERS[fmt](iter_batches(group_id))
@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import config
+import database
+import models
+
+# -> Idempotency-Key support for every POST endpoint, as a pure ASGI middleware in front of the routes.
+# -> the first request with a key claims it in idempotency_keys, runs normally and stores its response there.
+# -> a retry with the same key gets that stored response back without running the route (or crud) again,
+# -> and a duplicate arriving while the first one is still running waits for it on the key's row.
+
+HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.05
+
+table = models.IdempotencyKey.__table__
+
+
+# this runs fn(connection, *args) in its own short transaction, on the async engine when DB_ASYNC is on
+# and in the threadpool otherwise, like routes.call does for the crud functions
+async def _run(fn, *args):
+    if database.async_engine is not None:
+        async with database.async_engine.begin() as conn:
+            return await conn.run_sync(fn, *args)
+
+    def in_thread():
+        with database.engine.begin() as conn:
+            return fn(conn, *args)
+    return await run_in_threadpool(in_thread)
+
+
+# this takes the key, either a new one or one whose stored response expired or whose request died
+# without finishing. it returns False when another request holds it or already answered it.
+def claim(conn, key: str, method: str, path: str) -> bool:
+    now = datetime.utcnow()
+    values = {
+        "key": key,
+        "method": method,
+        "path": path,
+        "body_hash": None,
+        "status_code": None,
+        "response_headers": None,
+        "response_body": None,
+        "created_at": now,
+        "locked_until": now + timedelta(seconds=config.IDEMPOTENCY_LOCK_SECONDS),
+        "expires_at": now + timedelta(seconds=config.IDEMPOTENCY_TTL_SECONDS),
+    }
+    insert = (postgresql_insert if conn.dialect.name == "postgresql" else sqlite_insert)(table).values(**values)
+    stmt = insert.on_conflict_do_update(
+        index_elements=[table.c.key],
+        set_={col: insert.excluded[col] for col in values if col != "key"},
+        where=(table.c.expires_at < now) | (table.c.status_code.is_(None) & (table.c.locked_until < now))
+    ).returning(table.c.key)
+    return conn.execute(stmt).first() is not None
+
+
+def fetch(conn, key: str):
+    return conn.execute(select(table).where(table.c.key == key)).first()
+
+
+def store(conn, key: str, body_hash: str, status_code: int, headers: list, body: bytes):
+    conn.execute(update(table).where(table.c.key == key).values(
+        body_hash=body_hash,
+        status_code=status_code,
+        response_headers=json.dumps(headers),
+        response_body=body
+    ))
+
+
+# this gives the key back after a failed request, so a retry runs it again instead of replaying the failure
+def release(conn, key: str):
+    conn.execute(delete(table).where(table.c.key == key, table.c.status_code.is_(None)))
+
+
+def purge(conn) -> int:
+    return conn.execute(delete(table).where(table.c.expires_at < datetime.utcnow())).rowcount
+
+
+async def _send_error(send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({"type": "http.response.start", "status": status_code, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("latin-1"))
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _hash_body(receive) -> str:
+    hasher = hashlib.sha256()
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        hasher.update(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return hasher.hexdigest()
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        key = dict(scope["headers"]).get(HEADER)
+        if key is None:
+            return await self.app(scope, receive, send)
+
+        key = key.decode("latin-1").strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return await _send_error(send, 400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+
+        owner, row = await self._acquire(key, scope["method"], scope["path"])
+        if owner:
+            return await self._run_and_store(key, scope, receive, send)
+        if row is None:
+            return await _send_error(send, 409, "A request with this Idempotency-Key is still being processed")
+        await self._replay(row, scope, receive, send)
+
+    # this claims the key, or waits for the request holding it until that one stored its response
+    async def _acquire(self, key: str, method: str, path: str) -> tuple:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            if await _run(claim, key, method, path):
+                return True, None
+            row = await _run(fetch, key)
+            if row is not None and row.status_code is not None:
+                return False, row
+            if loop.time() >= deadline:
+                return False, None
+            await asyncio.sleep(POLL_SECONDS)
+
+    # the body is hashed while the route reads it, nothing is buffered apart from the response
+    async def _run_and_store(self, key: str, scope, receive, send):
+        hasher = hashlib.sha256()
+        body_done = False
+        response = {"status": None, "headers": [], "body": []}
+
+        async def hashing_receive():
+            nonlocal body_done
+            message = await receive()
+            if message["type"] == "http.request":
+                hasher.update(message.get("body", b""))
+                body_done = not message.get("more_body", False)
+            else:
+                body_done = True
+            return message
+
+        async def capturing_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, hashing_receive, capturing_send)
+        except BaseException:
+            await _run(release, key)
+            raise
+
+        if response["status"] is None or response["status"] >= 500:
+            await _run(release, key)
+            return
+        # a route that answered without reading the whole body (a 415, a 404 before parsing) still gets the
+        # full hash, a retry is compared against the complete request
+        while not body_done:
+            await hashing_receive()
+        headers = [[k.decode("latin-1"), v.decode("latin-1")] for k, v in response["headers"]]
+        await _run(store, key, hasher.hexdigest(), response["status"], headers, b"".join(response["body"]))
+
+    async def _replay(self, row, scope, receive, send):
+        if (row.method, row.path) != (scope["method"], scope["path"]) or await _hash_body(receive) != row.body_hash:
+            return await _send_error(send, 422, "Idempotency-Key was already used for a different request")
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in json.loads(row.response_headers)]
+        await send({
+            "type": "http.response.start",
+            "status": row.status_code,
+            "headers": headers + [(b"idempotent-replayed", b"true")]
+        })
+        await send({"type": "http.response.body", "body": row.response_body})
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Delete the expired idempotency keys")
+    parser.add_argument("command", choices=["purge"])
+    parser.parse_args(argv)
+
+    with database.engine.begin() as conn:
+        print(f"{purge(conn)} expired idempotency key(s) deleted")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
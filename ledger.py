@@ -0,0 +1,399 @@
+import argparse
+import sys
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import BigInteger, bindparam, cast, func, insert, select, true, update
+from sqlalchemy.orm import Session, aliased
+import config
+import models
+import money
+import splits
+from database import SessionLocal
+
+COLUMNS = ("total_paid", "total_owed", "total_sent", "total_received")
+
+# -> member_balances column -> ledger_events column
+EVENT_COLUMNS = {
+    "total_paid": "paid",
+    "total_owed": "owed",
+    "total_sent": "sent",
+    "total_received": "received",
+}
+
+# -> the balances are event sourced: every write appends ledger_events rows, member_balances is a snapshot of
+# -> those events up to last_event_id, and the current totals are the snapshot plus the short tail after it.
+# -> the writers of a group hold its row lock while appending, so the events of a group are committed in id
+# -> order and a snapshot taken under the same lock never skips one that is still in flight.
+
+
+# this appends events, each one is (kind, reference_id, member_id, {"total_paid": cents, ...}).
+# it only flushes, so the caller's commit puts them in the same transaction as the write,
+# and folds the tail into the snapshot once it grew past LEDGER_SNAPSHOT_EVERY.
+def append_events(db: Session, group_id, events: list, snapshot_every: int = None):
+    if not events:
+        return
+
+    db.execute(insert(models.LedgerEvent), [
+        {
+            "group_id": group_id,
+            "member_id": member_id,
+            "kind": kind,
+            "reference_id": reference_id,
+            **{EVENT_COLUMNS[col]: money.from_cents(deltas.get(col, 0)) for col in COLUMNS}
+        }
+        for kind, reference_id, member_id, deltas in events
+    ])
+
+    snapshot_every = config.LEDGER_SNAPSHOT_EVERY if snapshot_every is None else snapshot_every
+    if tail_size(db, group_id) > snapshot_every:
+        snapshot(db, group_id)
+
+
+# the events of the group not in the snapshot yet. the group's lowest snapshot id bounds the index range
+# scan on (group_id, id) and the per-member condition picks the exact tail out of it
+def _tail_filter(group_id):
+    e, snapshots = models.LedgerEvent, aliased(models.MemberBalance)
+    return [
+        e.group_id == group_id,
+        e.id > select(func.coalesce(func.min(snapshots.last_event_id), 0)).where(snapshots.group_id == group_id).scalar_subquery(),
+    ]
+
+
+def tail_size(db: Session, group_id) -> int:
+    e, b = models.LedgerEvent, models.MemberBalance
+    return (
+        db.query(func.count())
+        .select_from(e)
+        .join(b, b.member_id == e.member_id)
+        .filter(e.id > b.last_event_id, *_tail_filter(group_id))
+        .scalar()
+    )
+
+
+# this gives (tail, columns) for reading current totals: tail is a per-member sum of the events after the
+# snapshot, to be outer joined on member_id next to member_balances, and columns are the four totals in cents.
+# filters narrows the events to the members being read, so only their tail gets summed.
+def current_totals(*filters) -> tuple:
+    e, b = models.LedgerEvent, models.MemberBalance
+    tail = (
+        select(e.member_id, *[func.sum(getattr(e, EVENT_COLUMNS[col])).label(col) for col in COLUMNS])
+        .join(b, b.member_id == e.member_id)
+        .where(e.id > b.last_event_id, *filters)
+        .group_by(e.member_id)
+        .subquery()
+    )
+    return tail, _columns(tail)
+
+
+def _columns(tail) -> list:
+    b = models.MemberBalance
+    return [
+        cast(func.round((func.coalesce(getattr(b, col), 0) + func.coalesce(getattr(tail.c, col), 0)) * 100), BigInteger)
+        for col in COLUMNS
+    ]
+
+
+def group_totals(group_id) -> tuple:
+    return current_totals(*_tail_filter(group_id))
+
+
+# this is group_totals for many groups at once. every group's lowest snapshot id bounds the range scan of its own
+# events, so each group reads its short tail whatever the snapshots of the other groups are at. on postgres the
+# per group scan is a LATERAL subquery: as a plain join the planner costs the range as a third of the group's
+# history and may scan the whole table instead. sqlite has no LATERAL and walks the plain join group by group anyway
+def groups_totals(db: Session, group_ids) -> tuple:
+    e, b, snapshots = models.LedgerEvent, models.MemberBalance, aliased(models.MemberBalance)
+    bounds = (
+        select(snapshots.group_id, func.min(snapshots.last_event_id).label("last_event_id"))
+        .where(snapshots.group_id.in_(group_ids))
+        .group_by(snapshots.group_id)
+        .subquery()
+    )
+    per_group = (
+        select(e.member_id, *[func.sum(getattr(e, EVENT_COLUMNS[col])).label(col) for col in COLUMNS])
+        .join(b, b.member_id == e.member_id)
+        .where(e.group_id == bounds.c.group_id, e.id > bounds.c.last_event_id, e.id > b.last_event_id)
+        .group_by(e.member_id)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        group_tail = per_group.lateral()
+        tail = select(group_tail).select_from(bounds).join(group_tail, true()).subquery()
+    else:
+        tail = per_group.subquery()
+    return tail, _columns(tail)
+
+
+# this is the balance of one member in cents, its snapshot row plus its own tail, for validating settlements
+def member_cents(db: Session, member_id) -> int:
+    e, b = models.LedgerEvent, models.MemberBalance
+    tail, columns = current_totals(e.member_id == member_id)
+    row = (
+        db.query(*columns)
+        .select_from(b)
+        .outerjoin(tail, tail.c.member_id == b.member_id)
+        .filter(b.member_id == member_id)
+        .first()
+    )
+    return int(money.net_balances([row or (0, 0, 0, 0)])[0])
+
+
+# this folds the tail of a group into member_balances. every member of the group moves to the same
+# last_event_id, members without new events too, so the group's lowest id keeps up with the tail
+def snapshot(db: Session, group_id) -> int:
+    e, b = models.LedgerEvent, models.MemberBalance
+    tail = (
+        db.query(e.member_id, *[func.sum(getattr(e, EVENT_COLUMNS[col])) for col in COLUMNS], func.count())
+        .join(b, b.member_id == e.member_id)
+        .filter(e.id > b.last_event_id, *_tail_filter(group_id))
+        .group_by(e.member_id)
+        .all()
+    )
+    last_event_id = db.query(func.max(e.id)).filter(e.group_id == group_id).scalar()
+    if not tail or last_event_id is None:
+        return 0
+
+    table = b.__table__
+    stmt = (
+        update(table)
+        .where(table.c.member_id == bindparam("b_member_id"))
+        .values({col: table.c[col] + bindparam(f"b_{col}") for col in COLUMNS})
+    )
+    db.execute(stmt, [
+        {"b_member_id": member_id, **{f"b_{col}": amount or 0 for col, amount in zip(COLUMNS, amounts)}}
+        for member_id, *amounts, _ in tail
+    ])
+    db.execute(update(table).where(table.c.group_id == group_id).values(last_event_id=last_event_id))
+    return sum(count for *_, count in tail)
+
+
+# this is the current event id of a group, new members start their snapshot there
+def last_event_id(db: Session, group_id) -> int:
+    return db.query(func.coalesce(func.max(models.LedgerEvent.id), 0)).filter(models.LedgerEvent.group_id == group_id).scalar()
+
+
+# this recomputes the running totals straight from the expenses, splits and settlements tables, compact splits included
+def compute_from_raw(db: Session, group_id=None) -> dict:
+    totals = defaultdict(lambda: dict.fromkeys(COLUMNS, Decimal("0")))
+
+    members = db.query(models.GroupMember.id, models.GroupMember.group_id)
+    if group_id:
+        members = members.filter(models.GroupMember.group_id == group_id)
+    groups = {}
+    for member_id, member_group_id in members:
+        groups[member_id] = member_group_id
+        totals[member_id]
+
+    paid = db.query(models.Expense.paid_by, func.sum(models.Expense.amount)).group_by(models.Expense.paid_by)
+    owed = db.query(models.SplitDetail.member_id, func.sum(models.SplitDetail.amount)).group_by(models.SplitDetail.member_id)
+    sent = db.query(models.Settlement.from_member_id, func.sum(models.Settlement.amount)).group_by(models.Settlement.from_member_id)
+    received = db.query(models.Settlement.to_member_id, func.sum(models.Settlement.amount)).group_by(models.Settlement.to_member_id)
+    if group_id:
+        paid = paid.filter(models.Expense.group_id == group_id)
+        owed = owed.filter(models.SplitDetail.group_id == group_id)
+        sent = sent.filter(models.Settlement.group_id == group_id)
+        received = received.filter(models.Settlement.group_id == group_id)
+
+    for column, query in zip(COLUMNS, (paid, owed, sent, received)):
+        for member_id, amount in query:
+            if member_id in groups:
+                totals[member_id][column] = amount or Decimal("0")
+
+    # the compact splits are derived from their expense rows and added on top of the split_details sums
+    compact = db.query(models.Expense.amount, models.Expense.split_rule, models.Expense.split_members).filter(
+        models.Expense.split_rule.isnot(None)
+    )
+    if group_id:
+        compact = compact.filter(models.Expense.group_id == group_id)
+    for amount, rule, packed in compact.yield_per(1000):
+        for member_id, cents, _ in splits.shares(rule, packed, money.to_cents(amount)):
+            if member_id in groups:
+                totals[member_id]["total_owed"] += money.from_cents(cents)
+
+    return {member_id: (groups[member_id], values) for member_id, values in totals.items()}
+
+
+# this compares the stored ledger against the raw rows, and returns one entry per member that drifted
+def verify(db: Session, group_id=None) -> list:
+    expected = compute_from_raw(db, group_id)
+
+    tail, columns = current_totals(*([models.LedgerEvent.group_id == group_id] if group_id else []))
+    stored = (
+        db.query(models.MemberBalance.member_id, *columns)
+        .outerjoin(tail, tail.c.member_id == models.MemberBalance.member_id)
+    )
+    if group_id:
+        stored = stored.filter(models.MemberBalance.group_id == group_id)
+    stored = {member_id: dict(zip(COLUMNS, map(money.from_cents, cents))) for member_id, *cents in stored}
+
+    drift = []
+    for member_id, (member_group_id, values) in expected.items():
+        row = stored.get(member_id)
+        for column in COLUMNS:
+            actual = row[column] if row else None
+            if actual != values[column]:
+                drift.append({
+                    "group_id": member_group_id,
+                    "member_id": member_id,
+                    "column": column,
+                    "stored": actual,
+                    "expected": values[column]
+                })
+    return drift
+
+
+# this brings the ledger back in line with the raw rows, and returns the drift it fixed. the event log stays the
+# source of the totals: every member whose events don't sum to the raw rows gets a "correction" event with the
+# difference, then the snapshots are replayed from the log, so a later replay gives the same totals again
+def rebuild(db: Session, group_id=None) -> list:
+    drift = verify(db, group_id)
+    e, b = models.LedgerEvent, models.MemberBalance
+
+    logged = db.query(e.member_id, *[func.sum(getattr(e, EVENT_COLUMNS[col])) for col in COLUMNS]).group_by(e.member_id)
+    snapshotted = db.query(b.member_id)
+    if group_id:
+        logged = logged.filter(e.group_id == group_id)
+        snapshotted = snapshotted.filter(b.group_id == group_id)
+    logged = {member_id: amounts for member_id, *amounts in logged}
+    snapshotted = {member_id for (member_id,) in snapshotted}
+
+    corrections = defaultdict(list)
+    for member_id, (member_group_id, values) in compute_from_raw(db, group_id).items():
+        amounts = logged.get(member_id, (0, 0, 0, 0))
+        deltas = {col: money.to_cents(values[col]) - money.to_cents(amount or 0) for col, amount in zip(COLUMNS, amounts)}
+        if any(deltas.values()):
+            corrections[member_group_id].append(("correction", None, member_id, deltas))
+        if member_id not in snapshotted:
+            # replay only updates existing snapshots, a member without one starts from zero before every event
+            db.add(models.MemberBalance(member_id=member_id, group_id=member_group_id, last_event_id=0))
+
+    for member_group_id, events in corrections.items():
+        # the group row lock keeps the events of the group in commit order, like the writers do
+        db.query(models.Group.id).filter_by(id=member_group_id).with_for_update(key_share=True).first()
+        append_events(db, member_group_id, events)
+    db.flush()
+    replay(db, group_id)
+    return drift
+
+
+# this rebuilds the snapshots from the event log alone, replaying every event of the group(s).
+# it returns the members whose current totals changed, which only happens if a snapshot was damaged
+def replay(db: Session, group_id=None) -> list:
+    e, b = models.LedgerEvent, models.MemberBalance
+    tail, columns = current_totals(*([e.group_id == group_id] if group_id else []))
+    before = db.query(b.member_id, b.group_id, *columns).outerjoin(tail, tail.c.member_id == b.member_id)
+    if group_id:
+        before = before.filter(b.group_id == group_id)
+    before = {member_id: (member_group_id, cents) for member_id, member_group_id, *cents in before}
+
+    totals = db.query(e.member_id, *[func.sum(getattr(e, EVENT_COLUMNS[col])) for col in COLUMNS]).group_by(e.member_id)
+    last_ids = db.query(e.group_id, func.max(e.id)).group_by(e.group_id)
+    if group_id:
+        totals = totals.filter(e.group_id == group_id)
+        last_ids = last_ids.filter(e.group_id == group_id)
+    totals = {member_id: amounts for member_id, *amounts in totals}
+    last_ids = dict(last_ids)
+
+    drift = []
+    for member_id, (member_group_id, cents) in before.items():
+        amounts = [money.to_cents(amount or 0) for amount in totals.get(member_id, (0, 0, 0, 0))]
+        for column, stored, expected in zip(COLUMNS, cents, amounts):
+            if stored != expected:
+                drift.append({
+                    "group_id": member_group_id,
+                    "member_id": member_id,
+                    "column": column,
+                    "stored": money.from_cents(stored),
+                    "expected": money.from_cents(expected)
+                })
+        db.query(b).filter(b.member_id == member_id).update({
+            **{col: money.from_cents(amount) for col, amount in zip(COLUMNS, amounts)},
+            "last_event_id": last_ids.get(member_group_id, 0)
+        }, synchronize_session=False)
+    db.commit()
+    return drift
+
+
+# this recomputes the daily expense rollups from the expenses table, {(group_id, day): (amount, count)}
+def compute_rollups_from_raw(db: Session, group_id=None) -> dict:
+    day = func.date(models.Expense.created_at)
+    rows = (
+        db.query(models.Expense.group_id, day, func.sum(models.Expense.amount), func.count())
+        .filter(models.Expense.group_id.isnot(None), models.Expense.created_at.isnot(None))
+        .group_by(models.Expense.group_id, day)
+    )
+    if group_id:
+        rows = rows.filter(models.Expense.group_id == group_id)
+    return {
+        (row_group_id, date.fromisoformat(str(row_day))): (amount, count)
+        for row_group_id, row_day, amount, count in rows
+    }
+
+
+# this compares the stored daily rollups against the expenses, days that net to nothing count as matching
+def verify_rollups(db: Session, group_id=None) -> list:
+    expected = compute_rollups_from_raw(db, group_id)
+
+    stored = db.query(models.DailyGroupRollup)
+    if group_id:
+        stored = stored.filter(models.DailyGroupRollup.group_id == group_id)
+    stored = {(row.group_id, row.day): (row.total_amount, row.expense_count) for row in stored}
+
+    drift = []
+    for key in expected.keys() | stored.keys():
+        actual = stored.get(key, (Decimal("0"), 0))
+        values = expected.get(key, (Decimal("0"), 0))
+        for column, actual_value, expected_value in zip(("total_amount", "expense_count"), actual, values):
+            if actual_value != expected_value:
+                drift.append({
+                    "group_id": key[0],
+                    "day": key[1],
+                    "column": column,
+                    "stored": actual_value,
+                    "expected": expected_value
+                })
+    return drift
+
+
+# this overwrites the daily rollups with the recomputed ones, and returns the drift it fixed
+def rebuild_rollups(db: Session, group_id=None) -> list:
+    drift = verify_rollups(db, group_id)
+    stale = db.query(models.DailyGroupRollup)
+    if group_id:
+        stale = stale.filter(models.DailyGroupRollup.group_id == group_id)
+    stale.delete(synchronize_session=False)
+    for (row_group_id, day), (amount, count) in compute_rollups_from_raw(db, group_id).items():
+        db.add(models.DailyGroupRollup(group_id=row_group_id, day=day, total_amount=amount, expense_count=count))
+    db.commit()
+    return drift
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Verify or rebuild the balance ledger and daily rollups from raw rows, or replay the snapshots from the event log"
+    )
+    parser.add_argument("command", choices=["verify", "rebuild", "replay"])
+    parser.add_argument("--group", help="only check this group id")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "verify":
+            drift = verify(db, args.group) + verify_rollups(db, args.group)
+        elif args.command == "replay":
+            drift = replay(db, args.group)
+        else:
+            drift = rebuild(db, args.group) + rebuild_rollups(db, args.group)
+    finally:
+        db.close()
+
+    for d in drift:
+        where = f"member={d['member_id']}" if "member_id" in d else f"day={d['day']}"
+        print(f"group={d['group_id']} {where} {d['column']}: stored={d['stored']} expected={d['expected']}")
+    print(f"{len(drift)} drifted value(s)" + (" fixed" if args.command != "verify" and drift else ""))
+
+    return 1 if drift and args.command == "verify" else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
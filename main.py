@@ -1,12 +1,20 @@
 from fastapi import FastAPI
 from routes import router
-import models
-from database import Base, engine
+from idempotency import IdempotencyMiddleware
+from profiling import ProfilingMiddleware
+import config
+import migrate
 
 app = FastAPI(title="Expense Splitter API")
 
-models.Base.metadata.create_all(bind=engine)
+# -> brings the schema up to date with the alembic migrations (used to be Base.metadata.create_all)
+migrate.upgrade()
 
 app.include_router(router)
 
+# -> POST requests carrying an Idempotency-Key header are answered once and replayed on retries
+app.add_middleware(IdempotencyMiddleware)
 
+# -> per route timings, statement counts and sampled profiles, added last so it also times the middleware above
+if config.PROFILING:
+    app.add_middleware(ProfilingMiddleware)
@@ -0,0 +1,36 @@
+import os
+import sys
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+import database
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+
+def alembic_config(connection=None) -> Config:
+    cfg = Config(ALEMBIC_INI)
+    cfg.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    if connection is not None:
+        cfg.attributes["connection"] = connection
+    return cfg
+
+
+# this brings the database schema up to the latest migration, it runs on app startup in place of create_all.
+# a database that was created by create_all before migrations existed gets stamped with the revision it matches first.
+def upgrade(engine=None, revision: str = "head"):
+    engine = engine or database.engine
+    with engine.begin() as connection:
+        # several app workers can start at once, only one of them should migrate
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('splitter_migrations'))"))
+
+        tables = inspect(connection).get_table_names()
+        cfg = alembic_config(connection)
+        if "groups" in tables and "alembic_version" not in tables:
+            command.stamp(cfg, "0002" if "member_balances" in tables else "0001")
+        command.upgrade(cfg, revision)
+
+
+if __name__ == "__main__":
+    upgrade(revision=sys.argv[1] if len(sys.argv) > 1 else "head")
@@ -0,0 +1,66 @@
+import re
+from logging.config import fileConfig
+from sqlalchemy import create_engine, pool
+from alembic import context
+import config as app_config
+import models
+
+config = context.config
+
+# -> when migrate.upgrade() runs us from the app it passes its own connection in, and the app keeps its logging setup
+connection = config.attributes.get("connection")
+
+if connection is None and config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = models.Base.metadata
+
+# -> the hash partitions of expenses, split_details and settlements (0009) aren't models, autogenerate leaves them
+# -> alone, along with the copies of the split foreign key postgres keeps for every partition of expenses
+PARTITION = re.compile(r"^(expenses|split_details|settlements)_p\d+$")
+
+
+def include_name(name, type_, parent_names) -> bool:
+    return not (type_ == "table" and PARTITION.match(name or ""))
+
+
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    return not (type_ == "foreign_key_constraint" and PARTITION.match(object.referred_table.name))
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=app_config.DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        include_name=include_name,
+        include_object=include_object,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    if connection is not None:
+        context.configure(
+            connection=connection, target_metadata=target_metadata, include_name=include_name, include_object=include_object
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    connectable = create_engine(app_config.DATABASE_URL, poolclass=pool.NullPool)
+    with connectable.connect() as conn:
+        context.configure(
+            connection=conn, target_metadata=target_metadata, include_name=include_name, include_object=include_object
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,79 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "users",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False, unique=True),
+    )
+    op.create_table(
+        "groups",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("description", sa.String(255)),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        "group_members",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("group_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("groups.id"), nullable=False),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+    )
+    op.create_table(
+        "expenses",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("description", sa.String()),
+        sa.Column("amount", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("paid_by", postgresql.UUID(as_uuid=True), sa.ForeignKey("group_members.id")),
+        sa.Column("group_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("groups.id")),
+        sa.Column("split_type", sa.String()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_table(
+        "split_details",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("expense_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("expenses.id")),
+        sa.Column("member_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("group_members.id")),
+        sa.Column("amount", sa.DECIMAL(10, 2), nullable=True),
+        sa.Column("percentage", sa.DECIMAL(5, 2), nullable=True),
+    )
+    op.create_table(
+        "settlements",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("group_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("groups.id"), nullable=False),
+        sa.Column("from_member_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("group_members.id"), nullable=False),
+        sa.Column("to_member_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("group_members.id"), nullable=False),
+        sa.Column("amount", sa.Numeric(10, 2), nullable=False),
+        sa.Column("settled_at", sa.DateTime()),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("settlements")
+    op.drop_table("split_details")
+    op.drop_table("expenses")
+    op.drop_table("group_members")
+    op.drop_table("groups")
+    op.drop_table("users")
@@ -0,0 +1,56 @@
+"""member balances ledger
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "member_balances",
+        sa.Column("member_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("group_members.id"), primary_key=True),
+        sa.Column("group_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("groups.id"), nullable=False),
+        sa.Column("total_paid", sa.Numeric(14, 2), nullable=False),
+        sa.Column("total_owed", sa.Numeric(14, 2), nullable=False),
+        sa.Column("total_sent", sa.Numeric(14, 2), nullable=False),
+        sa.Column("total_received", sa.Numeric(14, 2), nullable=False),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    op.create_index("ix_member_balances_group_id", "member_balances", ["group_id"])
+
+    # backfilling the totals of the members that already exist from the raw rows
+    op.execute(
+        """
+        INSERT INTO member_balances (member_id, group_id, total_paid, total_owed, total_sent, total_received, updated_at)
+        SELECT
+            gm.id,
+            gm.group_id,
+            COALESCE((SELECT SUM(e.amount) FROM expenses e WHERE e.paid_by = gm.id), 0),
+            COALESCE((SELECT SUM(sd.amount) FROM split_details sd WHERE sd.member_id = gm.id), 0),
+            COALESCE((SELECT SUM(s.amount) FROM settlements s WHERE s.from_member_id = gm.id), 0),
+            COALESCE((SELECT SUM(s.amount) FROM settlements s WHERE s.to_member_id = gm.id), 0),
+            CURRENT_TIMESTAMP
+        FROM group_members gm
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_member_balances_group_id", table_name="member_balances")
+    op.drop_table("member_balances")
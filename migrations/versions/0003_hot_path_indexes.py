@@ -0,0 +1,52 @@
+"""indexes for the hot query paths
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # expenses of a group, in time order for the timeline (and per payer for the paid totals)
+    op.create_index("ix_expenses_group_id_created_at", "expenses", ["group_id", "created_at"])
+    op.create_index("ix_expenses_group_id_paid_by", "expenses", ["group_id", "paid_by"])
+    op.create_index("ix_expenses_paid_by", "expenses", ["paid_by"])
+
+    # splits are joined to their expense and summed per member, member_id and amount ride along
+    # in the expense_id index so the sums can be answered from the index alone
+    op.create_index("ix_split_details_expense_id", "split_details", ["expense_id", "member_id", "amount"])
+    op.create_index("ix_split_details_member_id", "split_details", ["member_id"])
+
+    # one membership per user and group, the unique index also serves the group lookups
+    op.create_index("uq_group_members_group_id_user_id", "group_members", ["group_id", "user_id"], unique=True)
+    op.create_index("ix_group_members_user_id", "group_members", ["user_id"])
+
+    op.create_index("ix_settlements_group_id_settled_at", "settlements", ["group_id", "settled_at"])
+    op.create_index("ix_settlements_from_member_id", "settlements", ["from_member_id"])
+    op.create_index("ix_settlements_to_member_id", "settlements", ["to_member_id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_settlements_to_member_id", table_name="settlements")
+    op.drop_index("ix_settlements_from_member_id", table_name="settlements")
+    op.drop_index("ix_settlements_group_id_settled_at", table_name="settlements")
+    op.drop_index("ix_group_members_user_id", table_name="group_members")
+    op.drop_index("uq_group_members_group_id_user_id", table_name="group_members")
+    op.drop_index("ix_split_details_member_id", table_name="split_details")
+    op.drop_index("ix_split_details_expense_id", table_name="split_details")
+    op.drop_index("ix_expenses_paid_by", table_name="expenses")
+    op.drop_index("ix_expenses_group_id_paid_by", table_name="expenses")
+    op.drop_index("ix_expenses_group_id_created_at", table_name="expenses")
@@ -0,0 +1,31 @@
+"""expense keyset index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the expense listing pages on (created_at, id), with id in the index every page is one index range scan.
+    # the timeline keeps using it through the (group_id, created_at) prefix
+    op.create_index("ix_expenses_group_id_created_at_id", "expenses", ["group_id", "created_at", "id"])
+    op.drop_index("ix_expenses_group_id_created_at", table_name="expenses")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index("ix_expenses_group_id_created_at", "expenses", ["group_id", "created_at"])
+    op.drop_index("ix_expenses_group_id_created_at_id", table_name="expenses")
@@ -0,0 +1,46 @@
+"""daily group rollups
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "daily_group_rollups",
+        sa.Column("group_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("groups.id"), primary_key=True),
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("total_amount", sa.Numeric(14, 2), nullable=False),
+        sa.Column("expense_count", sa.Integer(), nullable=False),
+    )
+
+    # backfilling one row per group and day from the expenses that already exist
+    op.execute(
+        """
+        INSERT INTO daily_group_rollups (group_id, day, total_amount, expense_count)
+        SELECT group_id, DATE(created_at), SUM(amount), COUNT(*)
+        FROM expenses
+        WHERE group_id IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY group_id, DATE(created_at)
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("daily_group_rollups")
@@ -0,0 +1,101 @@
+"""ledger events
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "ledger_events",
+        sa.Column("id", sa.BigInteger().with_variant(sa.Integer(), "sqlite"), primary_key=True, autoincrement=True),
+        sa.Column("group_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("groups.id"), nullable=False),
+        sa.Column("member_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("group_members.id"), nullable=False),
+        sa.Column("kind", sa.String(20), nullable=False),
+        sa.Column("reference_id", postgresql.UUID(as_uuid=True)),
+        sa.Column("paid", sa.Numeric(14, 2), nullable=False),
+        sa.Column("owed", sa.Numeric(14, 2), nullable=False),
+        sa.Column("sent", sa.Numeric(14, 2), nullable=False),
+        sa.Column("received", sa.Numeric(14, 2), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_ledger_events_group_id_id", "ledger_events", ["group_id", "id"])
+    op.create_index("ix_ledger_events_member_id_id", "ledger_events", ["member_id", "id"])
+    op.add_column("member_balances", sa.Column("last_event_id", sa.BigInteger(), nullable=False, server_default="0"))
+
+    # the history so far becomes events, so replaying the log gives the same totals as the existing snapshots
+    op.execute(
+        """
+        INSERT INTO ledger_events (group_id, member_id, kind, reference_id, paid, owed, sent, received, created_at)
+        SELECT group_id, paid_by, 'expense', id, amount, 0, 0, 0, created_at
+        FROM expenses
+        WHERE group_id IS NOT NULL AND paid_by IS NOT NULL
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO ledger_events (group_id, member_id, kind, reference_id, paid, owed, sent, received, created_at)
+        SELECT e.group_id, sd.member_id, 'split', e.id, 0, COALESCE(sd.amount, 0), 0, 0, e.created_at
+        FROM split_details sd
+        JOIN expenses e ON e.id = sd.expense_id
+        WHERE e.group_id IS NOT NULL AND sd.member_id IS NOT NULL
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO ledger_events (group_id, member_id, kind, reference_id, paid, owed, sent, received, created_at)
+        SELECT group_id, from_member_id, 'settlement', id, 0, 0, amount, 0, settled_at FROM settlements
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO ledger_events (group_id, member_id, kind, reference_id, paid, owed, sent, received, created_at)
+        SELECT group_id, to_member_id, 'settlement', id, 0, 0, 0, amount, settled_at FROM settlements
+        """
+    )
+    # the existing totals already include all of it, so every snapshot starts at the end of the backfill
+    op.execute(
+        """
+        UPDATE member_balances
+        SET last_event_id = COALESCE(
+            (SELECT MAX(le.id) FROM ledger_events le WHERE le.group_id = member_balances.group_id), 0
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # the events after each snapshot are folded into it first, member_balances has to hold the full totals again
+    op.execute(
+        """
+        UPDATE member_balances SET
+            total_paid = total_paid + COALESCE((SELECT SUM(le.paid) FROM ledger_events le
+                WHERE le.member_id = member_balances.member_id AND le.id > member_balances.last_event_id), 0),
+            total_owed = total_owed + COALESCE((SELECT SUM(le.owed) FROM ledger_events le
+                WHERE le.member_id = member_balances.member_id AND le.id > member_balances.last_event_id), 0),
+            total_sent = total_sent + COALESCE((SELECT SUM(le.sent) FROM ledger_events le
+                WHERE le.member_id = member_balances.member_id AND le.id > member_balances.last_event_id), 0),
+            total_received = total_received + COALESCE((SELECT SUM(le.received) FROM ledger_events le
+                WHERE le.member_id = member_balances.member_id AND le.id > member_balances.last_event_id), 0)
+        """
+    )
+    op.drop_column("member_balances", "last_event_id")
+    op.drop_index("ix_ledger_events_member_id_id", table_name="ledger_events")
+    op.drop_index("ix_ledger_events_group_id_id", table_name="ledger_events")
+    op.drop_table("ledger_events")
@@ -0,0 +1,162 @@
+"""compact splits
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 00:00:00
+
+"""
+import struct
+import uuid
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, Sequence[str], None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+FULL_PERCENT = 10000
+WEIGHT = struct.Struct(">H")
+
+expenses = sa.table(
+    "expenses",
+    sa.column("id", postgresql.UUID(as_uuid=True)),
+    sa.column("amount", sa.Numeric(10, 2)),
+    sa.column("split_type", sa.String()),
+    sa.column("split_rule", sa.String(20)),
+    sa.column("split_members", sa.LargeBinary()),
+)
+split_details = sa.table(
+    "split_details",
+    sa.column("id", postgresql.UUID(as_uuid=True)),
+    sa.column("expense_id", postgresql.UUID(as_uuid=True)),
+    sa.column("member_id", postgresql.UUID(as_uuid=True)),
+    sa.column("amount", sa.Numeric(10, 2)),
+    sa.column("percentage", sa.Numeric(5, 2)),
+)
+
+
+# the money and splits math of the app as of this revision, copied so the migration keeps working when those change
+def _cents(amount) -> int:
+    return int(Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+
+
+def _allocate(total: int, weights: list) -> list:
+    weight_sum = sum(weights)
+    shares = [w * total // weight_sum for w in weights]
+    remainders = [w * total - share * weight_sum for w, share in zip(weights, shares)]
+    for i in sorted(range(len(weights)), key=lambda i: -remainders[i])[:total - sum(shares)]:
+        shares[i] += 1
+    return shares
+
+
+# this gives (split_rule, split_members) for the split rows of an expense, or None when the rows can't be derived
+# back from a rule (old float-rounded amounts, a missing percentage, ...) and have to stay rows. the members that
+# got a left over cent are packed first, so the largest remainder method hands it to them again
+def _compact(split_type: str, total: int, rows: list):
+    if not rows or any(member_id is None or amount is None for member_id, amount, _ in rows):
+        return None
+    if split_type == "PERCENTAGE":
+        if any(percentage is None for _, _, percentage in rows):
+            return None
+        weights = [_cents(percentage) for _, _, percentage in rows]
+        if sum(weights) != FULL_PERCENT:
+            return None
+    else:
+        weights = [1] * len(rows)
+    cents = [_cents(amount) for _, amount, _ in rows]
+    floors = [w * total // sum(weights) for w in weights]
+    order = sorted(range(len(rows)), key=lambda i: floors[i] - cents[i])
+    if _allocate(total, [weights[i] for i in order]) != [cents[i] for i in order]:
+        return None
+    if split_type == "PERCENTAGE":
+        return split_type, b"".join(rows[i][0].bytes + WEIGHT.pack(weights[i]) for i in order)
+    return split_type, b"".join(rows[i][0].bytes for i in order)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("expenses", sa.Column("split_rule", sa.String(20)))
+    op.add_column("expenses", sa.Column("split_members", sa.LargeBinary()))
+
+    # the EQUAL and PERCENTAGE splits move onto their expense rows in batches, the rows that don't match
+    # what the rule derives are left as they are
+    conn = op.get_bind()
+    update = (
+        expenses.update()
+        .where(expenses.c.id == sa.bindparam("b_id"))
+        .values(split_rule=sa.bindparam("b_rule"), split_members=sa.bindparam("b_members"))
+    )
+    last_id = None
+    while True:
+        batch = (
+            sa.select(expenses.c.id, expenses.c.amount, expenses.c.split_type)
+            .where(expenses.c.split_type.in_(("EQUAL", "PERCENTAGE")), expenses.c.amount.isnot(None))
+            .order_by(expenses.c.id)
+            .limit(BATCH_SIZE)
+        )
+        if last_id is not None:
+            batch = batch.where(expenses.c.id > last_id)
+        batch = conn.execute(batch).all()
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        rows = {expense_id: [] for expense_id, _, _ in batch}
+        for expense_id, member_id, amount, percentage in conn.execute(
+            sa.select(split_details.c.expense_id, split_details.c.member_id, split_details.c.amount, split_details.c.percentage)
+            .where(split_details.c.expense_id.in_(list(rows)))
+        ):
+            rows[expense_id].append((member_id, amount, percentage))
+
+        converted = []
+        for expense_id, amount, split_type in batch:
+            compact = _compact(split_type, _cents(amount), rows[expense_id])
+            if compact:
+                converted.append({"b_id": expense_id, "b_rule": compact[0], "b_members": compact[1]})
+        if converted:
+            conn.execute(update, converted)
+            conn.execute(split_details.delete().where(split_details.c.expense_id.in_([c["b_id"] for c in converted])))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # every compact split is written back out as split_details rows before the columns go
+    conn = op.get_bind()
+    compact = conn.execute(
+        sa.select(expenses.c.id, expenses.c.amount, expenses.c.split_rule, expenses.c.split_members)
+        .where(expenses.c.split_rule.isnot(None))
+    )
+    for batch in compact.partitions(BATCH_SIZE):
+        split_rows = []
+        for expense_id, amount, rule, packed in batch:
+            packed = bytes(packed)
+            if rule == "PERCENTAGE":
+                stride = 16 + WEIGHT.size
+                entries = [
+                    (uuid.UUID(bytes=packed[i:i + 16]), WEIGHT.unpack_from(packed, i + 16)[0])
+                    for i in range(0, len(packed), stride)
+                ]
+            else:
+                entries = [(uuid.UUID(bytes=packed[i:i + 16]), None) for i in range(0, len(packed), 16)]
+            weights = [weight if weight is not None else 1 for _, weight in entries]
+            for (member_id, weight), cents in zip(entries, _allocate(_cents(amount), weights)):
+                split_rows.append({
+                    "id": uuid.uuid4(),
+                    "expense_id": expense_id,
+                    "member_id": member_id,
+                    "amount": Decimal(cents).scaleb(-2),
+                    "percentage": Decimal(weight).scaleb(-2) if weight is not None else None
+                })
+        if split_rows:
+            conn.execute(split_details.insert(), split_rows)
+
+    op.drop_column("expenses", "split_members")
+    op.drop_column("expenses", "split_rule")
@@ -0,0 +1,135 @@
+"""partition by group
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, Sequence[str], None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the modulus of the hash partitioning. changing it means rewriting the tables again, so it is fixed here
+PARTITIONS = 16
+TABLES = ("expenses", "split_details", "settlements")
+
+# the indexes and foreign keys of the three tables as of this revision, the partitioned tables get them anew
+INDEXES = [
+    ("ix_expenses_group_id_created_at_id", "expenses", ["group_id", "created_at", "id"]),
+    ("ix_expenses_group_id_paid_by", "expenses", ["group_id", "paid_by"]),
+    ("ix_expenses_paid_by", "expenses", ["paid_by"]),
+    ("ix_split_details_member_id", "split_details", ["member_id"]),
+    ("ix_settlements_group_id_settled_at", "settlements", ["group_id", "settled_at"]),
+    ("ix_settlements_from_member_id", "settlements", ["from_member_id"]),
+    ("ix_settlements_to_member_id", "settlements", ["to_member_id"]),
+]
+FOREIGN_KEYS = [
+    ("expenses_paid_by_fkey", "expenses", "group_members", ["paid_by"], ["id"]),
+    ("expenses_group_id_fkey", "expenses", "groups", ["group_id"], ["id"]),
+    ("split_details_member_id_fkey", "split_details", "group_members", ["member_id"], ["id"]),
+    ("split_details_group_id_fkey", "split_details", "groups", ["group_id"], ["id"]),
+    ("settlements_group_id_fkey", "settlements", "groups", ["group_id"], ["id"]),
+    ("settlements_from_member_id_fkey", "settlements", "group_members", ["from_member_id"], ["id"]),
+    ("settlements_to_member_id_fkey", "settlements", "group_members", ["to_member_id"], ["id"]),
+]
+
+
+# this swaps a table for a copy of it, hash partitioned on group_id when partitioned is set and a plain table
+# otherwise. the copy takes the columns and NOT NULLs of the old one, the old one goes with its indexes and the
+# foreign keys pointing at it, so the caller adds those back once every table is swapped
+def _rebuild(table: str, partitioned: bool):
+    op.execute(
+        f"CREATE TABLE {table}_new (LIKE {table} INCLUDING DEFAULTS)"
+        + (" PARTITION BY HASH (group_id)" if partitioned else "")
+    )
+    if partitioned:
+        for remainder in range(PARTITIONS):
+            op.execute(
+                f"CREATE TABLE {table}_p{remainder} PARTITION OF {table}_new "
+                f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})"
+            )
+    op.execute(f"INSERT INTO {table}_new SELECT * FROM {table}")
+    op.execute(f"DROP TABLE {table} CASCADE")
+    op.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+# this checks for rows without a group, they can't be placed in a partition and the app never reads them
+def _check_groupless(conn):
+    for table, column in (("expenses", "group_id"), ("split_details", "group_id")):
+        count = conn.execute(sa.text(f"SELECT COUNT(*) FROM {table} WHERE {column} IS NULL")).scalar()
+        if count:
+            raise RuntimeError(
+                f"{count} {table} row(s) have no group, they have to be removed or given one before migrating"
+            )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # split_details gets the group of its expense, so a group's splits are found without joining expenses
+    op.add_column("split_details", sa.Column("group_id", postgresql.UUID(as_uuid=True)))
+    op.execute(
+        """
+        UPDATE split_details
+        SET group_id = (SELECT e.group_id FROM expenses e WHERE e.id = split_details.expense_id)
+        """
+    )
+    conn = op.get_bind()
+    _check_groupless(conn)
+
+    # the group's splits are read in expense order, member_id and amount ride along for the index only sums
+    split_index = ("ix_split_details_group_id_expense_id", "split_details", ["group_id", "expense_id", "member_id", "amount"])
+    if conn.dialect.name != "postgresql":
+        # no partitioning elsewhere (sqlite for the benchmarks). the column stays nullable there and gets no foreign
+        # key, sqlite can only add those by copying the table
+        op.drop_index("ix_split_details_expense_id", table_name="split_details")
+        op.create_index(*split_index)
+        return
+
+    # the three tables are rewritten as hash partitioned ones. a primary key of a partitioned table has to
+    # hold the partition key, so the ids become (group_id, id) and a split points at (group_id, expense_id)
+    op.alter_column("split_details", "group_id", nullable=False)
+    for table in TABLES:
+        _rebuild(table, partitioned=True)
+        op.create_primary_key(f"{table}_pkey", table, ["group_id", "id"])
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+    op.create_index(*split_index)
+    for name, table, referred, local, remote in FOREIGN_KEYS:
+        op.create_foreign_key(name, table, referred, local, remote)
+    op.create_foreign_key(
+        "split_details_group_id_expense_id_fkey", "split_details", "expenses", ["group_id", "expense_id"], ["group_id", "id"]
+    )
+    # the new tables have no statistics yet, the planner would guess until autovacuum gets to them
+    for table in TABLES:
+        op.execute(f"ANALYZE {table}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "postgresql":
+        op.drop_index("ix_split_details_group_id_expense_id", table_name="split_details")
+        op.create_index("ix_split_details_expense_id", "split_details", ["expense_id", "member_id", "amount"])
+        op.drop_column("split_details", "group_id")
+        return
+
+    for table in TABLES:
+        _rebuild(table, partitioned=False)
+        op.create_primary_key(f"{table}_pkey", table, ["id"])
+    op.alter_column("expenses", "group_id", nullable=True)
+    op.drop_column("split_details", "group_id")
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+    op.create_index("ix_split_details_expense_id", "split_details", ["expense_id", "member_id", "amount"])
+    for name, table, referred, local, remote in FOREIGN_KEYS:
+        if name != "split_details_group_id_fkey":
+            op.create_foreign_key(name, table, referred, local, remote)
+    op.create_foreign_key("split_details_expense_id_fkey", "split_details", "expenses", ["expense_id"], ["id"])
@@ -0,0 +1,28 @@
+"""drop ledger reference index
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0011"
+down_revision: Union[str, Sequence[str], None] = "0010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the settle plan is worked out from the group balances now, nothing reads the events by expense id anymore
+    op.drop_index("ix_ledger_events_reference_id", table_name="ledger_events")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index("ix_ledger_events_reference_id", "ledger_events", ["reference_id"])
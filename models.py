@@ -1,17 +1,47 @@
 import uuid
 from datetime import datetime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
+import config
 from database import Base
 from sqlalchemy import (
+    BigInteger,
     Column,
     String,
+    Date,
     DateTime,
     ForeignKey,
+    ForeignKeyConstraint,
+    Integer,
     Numeric,
     DECIMAL,
+    Index,
+    LargeBinary,
+    PrimaryKeyConstraint,
+    Text,
 )
 
+# -> postgres UUID column that also accepts ids as strings, the routes pass their path parameters through as is.
+# -> postgres casts those itself, other databases (sqlite for the benchmarks) store the uuid's hex and need a uuid object.
+class UUID(TypeDecorator):
+    impl = postgresql.UUID
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            try:
+                return uuid.UUID(value)
+            except ValueError:
+                return value
+        return value
+
+
+# -> how relationships load when a query didn't load them up front. crud loads what it reads explicitly
+# -> (joinedload / selectinload / contains_eager), DB_STRICT_LOADING turns a forgotten one into an error
+LAZY = "raise" if config.DB_STRICT_LOADING else "select"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -19,7 +49,7 @@ class User(Base):
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
 
-    memberships = relationship("GroupMember", back_populates="user", cascade="all, delete-orphan")
+    memberships = relationship("GroupMember", back_populates="user", lazy=LAZY, cascade="all, delete-orphan")
 
 
 class Group(Base):
@@ -30,54 +60,154 @@ class Group(Base):
     description = Column(String(255))
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
-    members = relationship("GroupMember", back_populates="group", cascade="all, delete-orphan")
-    expenses = relationship("Expense", back_populates="group", cascade="all, delete-orphan")
+    members = relationship("GroupMember", back_populates="group", lazy=LAZY, cascade="all, delete-orphan")
+    expenses = relationship("Expense", back_populates="group", lazy=LAZY, cascade="all, delete-orphan")
 
 
 class GroupMember(Base):
     __tablename__ = "group_members"
+    __table_args__ = (
+        Index("uq_group_members_group_id_user_id", "group_id", "user_id", unique=True),
+        Index("ix_group_members_user_id", "user_id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     group_id = Column(UUID(as_uuid=True), ForeignKey("groups.id"), nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
 
-    group = relationship("Group", back_populates="members")
-    user = relationship("User", back_populates="memberships")
+    group = relationship("Group", back_populates="members", lazy=LAZY)
+    user = relationship("User", back_populates="memberships", lazy=LAZY)
+    balance = relationship("MemberBalance", back_populates="member", lazy=LAZY, uselist=False, cascade="all, delete-orphan")
 
 
+# -> expenses, split_details and settlements are hash partitioned on group_id on postgres (migration 0009), so their
+# -> primary keys are (group_id, id) and a split points at (group_id, expense_id). every query on them filters on
+# -> the group_id, so the planner only opens the partition of that group
 class Expense(Base):
     __tablename__ = "expenses"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    __table_args__ = (
+        PrimaryKeyConstraint("group_id", "id", name="expenses_pkey"),
+        Index("ix_expenses_group_id_created_at_id", "group_id", "created_at", "id"),
+        Index("ix_expenses_group_id_paid_by", "group_id", "paid_by"),
+        Index("ix_expenses_paid_by", "paid_by"),
+    )
+
+    id = Column(UUID(as_uuid=True), default=uuid.uuid4)
     description = Column(String)
     amount = Column(DECIMAL(10, 2), nullable=False)
     paid_by = Column(UUID(as_uuid=True), ForeignKey("group_members.id"))
-    group_id = Column(UUID(as_uuid=True), ForeignKey("groups.id"))
+    group_id = Column(UUID(as_uuid=True), ForeignKey("groups.id"), nullable=False)
     split_type = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # set for an EQUAL or PERCENTAGE split stored compact: the rule and the packed participants (see splits.py),
+    # such an expense has no split_details rows
+    split_rule = Column(String(20))
+    split_members = Column(LargeBinary)
 
-    group = relationship("Group", back_populates="expenses")
-    splits = relationship("SplitDetail", back_populates="expense")
+    group = relationship("Group", back_populates="expenses", lazy=LAZY)
+    splits = relationship("SplitDetail", back_populates="expense", lazy=LAZY)
 
 
 class SplitDetail(Base):
     __tablename__ = "split_details"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    expense_id = Column(UUID(as_uuid=True), ForeignKey("expenses.id"))
+    __table_args__ = (
+        PrimaryKeyConstraint("group_id", "id", name="split_details_pkey"),
+        ForeignKeyConstraint(["group_id", "expense_id"], ["expenses.group_id", "expenses.id"]),
+        Index("ix_split_details_group_id_expense_id", "group_id", "expense_id", "member_id", "amount"),
+        Index("ix_split_details_member_id", "member_id"),
+    )
+
+    id = Column(UUID(as_uuid=True), default=uuid.uuid4)
+    expense_id = Column(UUID(as_uuid=True))
+    # the group of the expense, copied here so a group's splits are found without joining expenses
+    group_id = Column(UUID(as_uuid=True), ForeignKey("groups.id"), nullable=False)
     member_id = Column(UUID(as_uuid=True), ForeignKey("group_members.id"))
     amount = Column(DECIMAL(10, 2), nullable=True)
     percentage = Column(DECIMAL(5, 2), nullable=True)
 
-    expense = relationship("Expense", back_populates="splits")
+    expense = relationship("Expense", back_populates="splits", lazy=LAZY)
 
 
 class Settlement(Base):
     __tablename__ = "settlements"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    __table_args__ = (
+        PrimaryKeyConstraint("group_id", "id", name="settlements_pkey"),
+        Index("ix_settlements_group_id_settled_at", "group_id", "settled_at"),
+        Index("ix_settlements_from_member_id", "from_member_id"),
+        Index("ix_settlements_to_member_id", "to_member_id"),
+    )
+
+    id = Column(UUID(as_uuid=True), default=uuid.uuid4)
     group_id = Column(UUID(as_uuid=True), ForeignKey("groups.id"), nullable=False)
     from_member_id = Column(UUID(as_uuid=True), ForeignKey("group_members.id"), nullable=False)
     to_member_id = Column(UUID(as_uuid=True), ForeignKey("group_members.id"), nullable=False)
     amount = Column(Numeric(10, 2), nullable=False)
-    settled_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    settled_at = Column(DateTime, default=datetime.utcnow)
+
+
+# -> running totals per group member, kept up to date by every write so balances
+# -> can be read without rescanning the whole expense history of the group.
+class MemberBalance(Base):
+    __tablename__ = "member_balances"
+
+    member_id = Column(UUID(as_uuid=True), ForeignKey("group_members.id"), primary_key=True)
+    group_id = Column(UUID(as_uuid=True), ForeignKey("groups.id"), nullable=False, index=True)
+    total_paid = Column(Numeric(14, 2), nullable=False, default=0)
+    total_owed = Column(Numeric(14, 2), nullable=False, default=0)
+    total_sent = Column(Numeric(14, 2), nullable=False, default=0)
+    total_received = Column(Numeric(14, 2), nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # the totals above are a snapshot of the ledger_events of this member up to this id
+    last_event_id = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+    member = relationship("GroupMember", back_populates="balance", lazy=LAZY)
+
+
+# -> expense totals per group and day, kept up to date by every expense write so the analytics
+# -> timeline reads one row per day instead of every expense of the group.
+class DailyGroupRollup(Base):
+    __tablename__ = "daily_group_rollups"
+
+    group_id = Column(UUID(as_uuid=True), ForeignKey("groups.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    total_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    expense_count = Column(Integer, nullable=False, default=0)
+
+
+# -> append-only ledger, one row per change to a member's totals. member_balances holds a snapshot of it
+# -> and the current totals are that snapshot plus the events appended since (see ledger.py).
+class LedgerEvent(Base):
+    __tablename__ = "ledger_events"
+    __table_args__ = (
+        Index("ix_ledger_events_group_id_id", "group_id", "id"),
+        Index("ix_ledger_events_member_id_id", "member_id", "id"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    group_id = Column(UUID(as_uuid=True), ForeignKey("groups.id"), nullable=False)
+    member_id = Column(UUID(as_uuid=True), ForeignKey("group_members.id"), nullable=False)
+    kind = Column(String(20), nullable=False)
+    # expense or settlement id, no foreign key so the events of a deleted expense stay in the history
+    reference_id = Column(UUID(as_uuid=True))
+    paid = Column(Numeric(14, 2), nullable=False, default=0)
+    owed = Column(Numeric(14, 2), nullable=False, default=0)
+    sent = Column(Numeric(14, 2), nullable=False, default=0)
+    received = Column(Numeric(14, 2), nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# -> stored responses of the POST requests sent with an Idempotency-Key header (see idempotency.py).
+# -> a row without status_code is a request that is still running, locked_until says how long it may take.
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    method = Column(String(10), nullable=False)
+    path = Column(String, nullable=False)
+    body_hash = Column(String(64))
+    status_code = Column(Integer)
+    response_headers = Column(Text)
+    response_body = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
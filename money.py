@@ -0,0 +1,80 @@
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+
+# -> money core: the split and balance math works on int64 cents, Decimal only shows up at the edges
+# -> (request bodies and the Numeric columns) and float only in the JSON the read endpoints return.
+
+CENT = Decimal("0.01")
+
+# -> split_details.percentage is DECIMAL(5, 2), so percentages are weighted in hundredths of a percent
+PERCENT_SCALE = 100
+FULL_PERCENT = 100 * PERCENT_SCALE
+
+
+# this converts a money amount to integer cents, rounding half up like the Numeric columns do
+def to_cents(amount) -> int:
+    return int(Decimal(str(amount)).quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+# this gives the Decimal for cents, for the Numeric columns and the Decimal response fields
+def from_cents(cents) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+# this gives the float for cents, for the JSON responses that have always returned numbers
+def to_units(cents) -> float:
+    return int(cents) / 100
+
+
+# this converts a percentage to an integer weight in hundredths of a percent
+def percent_weight(percentage) -> int:
+    return int(Decimal(str(percentage)).quantize(CENT, rounding=ROUND_HALF_UP) * PERCENT_SCALE)
+
+
+# this splits total cents proportionally to the integer weights with the largest remainder method:
+# everyone gets the floor of their exact share, and the cents left over go one each to the biggest
+# remainders (earlier entries win ties). the result always sums to total exactly.
+def allocate(total: int, weights) -> np.ndarray:
+    weights = np.asarray(weights, dtype=np.int64)
+    weight_sum = int(weights.sum())
+    if weight_sum <= 0:
+        raise ValueError("weights must sum to a positive number")
+
+    scaled = weights * total
+    shares = scaled // weight_sum
+    remainders = scaled - shares * weight_sum
+    left = total - int(shares.sum())
+    if left:
+        shares[np.argsort(-remainders, kind="stable")[:left]] += 1
+    return shares
+
+
+# this is allocate in plain python for the few participants of one expense, where numpy's per call overhead
+# costs more than the math. same rounding and tie breaking, same result
+def allocate_small(total: int, weights: list) -> list:
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise ValueError("weights must sum to a positive number")
+
+    shares = [w * total // weight_sum for w in weights]
+    left = total - sum(shares)
+    if left:
+        remainders = [w * total - share * weight_sum for w, share in zip(weights, shares)]
+        for i in sorted(range(len(weights)), key=remainders.__getitem__, reverse=True)[:left]:
+            shares[i] += 1
+    return shares
+
+
+def split_equal(total: int, count: int) -> np.ndarray:
+    return allocate(total, np.ones(count, dtype=np.int64))
+
+
+def split_percentage(total: int, weights) -> np.ndarray:
+    return allocate(total, weights)
+
+
+# this nets the ledger columns of many members at once, rows are
+# (total_paid, total_owed, total_sent, total_received) in cents and it returns one balance per row
+def net_balances(rows) -> np.ndarray:
+    matrix = np.asarray(rows, dtype=np.int64).reshape(-1, 4)
+    return matrix @ np.array([1, -1, 1, -1], dtype=np.int64)
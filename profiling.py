@@ -0,0 +1,214 @@
+import cProfile
+import contextvars
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event
+import config
+import database
+
+# -> per request instrumentation. the middleware puts a RequestStats in a contextvar, the sqlalchemy cursor
+# -> events add every statement of the request to it (run_in_threadpool and run_sync both carry the context
+# -> over), and when the request is done its numbers go into prometheus histograms per route.
+# -> a sample of the requests also runs under a profiler, and the slow ones among them are written to PROFILE_DIR.
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+ROWS_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds", "rows")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+# this keeps cumulative bucket counts, a sum and a count per label set, in the prometheus text format
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple, labels: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_values: tuple, value: float):
+        with self.lock:
+            counts = self.series.setdefault(label_values, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {labels: list(counts) for labels, counts in self.series.items()}
+        for label_values, counts in sorted(series.items()):
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {counts[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {counts[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {counts[-1]}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+LABELS = ("method", "route", "status")
+
+HISTOGRAMS = {
+    "duration": Histogram("http_request_duration_seconds", "Wall time of the request", SECONDS_BUCKETS, LABELS),
+    "statements": Histogram("http_request_db_statements", "SQL statements executed by the request", COUNT_BUCKETS, LABELS),
+    "db_seconds": Histogram("http_request_db_seconds", "Time spent executing SQL statements", SECONDS_BUCKETS, LABELS),
+    "rows": Histogram("http_request_db_rows", "Rows returned by the SQL statements of the request", ROWS_BUCKETS, LABELS),
+}
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+# the start time goes on the execution context, so a statement that fails half way leaves nothing behind
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None and context is not None:
+        context._profiling_start = time.perf_counter()
+
+
+# rows are what the cursor reports for statements returning rows. a server-side cursor (the streaming export)
+# doesn't know its row count up front and isn't counted
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    start = getattr(context, "_profiling_start", None)
+    if stats is None or start is None:
+        return
+    stats.db_seconds += time.perf_counter() - start
+    stats.statements += 1
+    if cursor.description is not None and cursor.rowcount and cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+_instrumented = set()
+
+
+# this hooks the cursor events into every engine in use, async engines through their sync_engine
+def instrument_engines():
+    engines = [database.engine, database.read_engine]
+    if database.async_engine is not None:
+        engines += [database.async_engine.sync_engine, database.async_read_engine.sync_engine]
+    for engine in engines:
+        if id(engine) in _instrumented:
+            continue
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        _instrumented.add(id(engine))
+
+
+def server_timing(stats: RequestStats, elapsed: float) -> bytes:
+    return (
+        f'app;dur={elapsed * 1000:.1f}, '
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.statements} statements, {stats.rows} rows"'
+    ).encode("latin-1")
+
+
+# only one profiler can run in the process at a time, and it sees every thread, so while a request is
+# profiled the others running alongside it end up in its profile too
+_profiler_lock = threading.Lock()
+
+
+def _start_profiler():
+    if not config.PROFILE_SAMPLE_RATE or random.random() >= config.PROFILE_SAMPLE_RATE:
+        return None
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    try:
+        if config.PROFILER == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+    except BaseException:
+        _profiler_lock.release()
+        raise
+    return profiler
+
+
+def _stop_profiler(profiler, elapsed: float, method: str, route: str):
+    try:
+        if config.PROFILER == "pyinstrument":
+            profiler.stop()
+        else:
+            profiler.disable()
+        if elapsed * 1000 < config.PROFILE_SLOW_MS:
+            return
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", f"{method} {route}").strip("_")
+        path = os.path.join(
+            config.PROFILE_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{name}-{elapsed * 1000:.0f}ms"
+        )
+        if config.PROFILER == "pyinstrument":
+            with open(path + ".html", "w") as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.dump_stats(path + ".prof")
+    finally:
+        _profiler_lock.release()
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        instrument_engines()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        profiler = _start_profiler()
+        start = time.perf_counter()
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(stats, time.perf_counter() - start)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            # the route template, not the raw path, so every group shares one series
+            route = scope["route"].path if "route" in scope else "unmatched"
+            labels = (scope["method"], route, str(status))
+            HISTOGRAMS["duration"].observe(labels, elapsed)
+            HISTOGRAMS["statements"].observe(labels, stats.statements)
+            HISTOGRAMS["db_seconds"].observe(labels, stats.db_seconds)
+            HISTOGRAMS["rows"].observe(labels, stats.rows)
+            if profiler is not None:
+                _stop_profiler(profiler, elapsed, scope["method"], route)
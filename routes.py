@@ -1,76 +1,301 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import random
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Literal, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+import bulk_import
+import cache
+import config
 import crud
+import export
+import profiling
 import schemas
-from database import SessionLocal   
+import serialization
+import settlement
+import database
+from database import AsyncReadSessionLocal, AsyncSessionLocal, ReadSessionLocal, SessionLocal
 router = APIRouter()
 
 # -> function that manages the database session, starts and closes it properly, we will use this function as 
 # -> as a dependency function, where ever we need db session.
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# -> with DB_ASYNC on it hands out an AsyncSession instead, so no threadpool worker is held for the request.
+# -> get_read_db is the same thing for read-only endpoints, it goes to the read replica when one is configured.
+if AsyncSessionLocal is not None:
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    async def get_read_db():
+        async with AsyncReadSessionLocal() as db:
+            yield db
+else:
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def get_read_db():
+        db = ReadSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+# -> this runs a crud function for an async route. on an AsyncSession the same sync crud code runs through
+# -> run_sync on the asyncpg connection, on a plain Session it goes to the threadpool like a sync route would.
+async def call(db, fn, *args):
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
+
+
+# -> runs CPU bound work (the debt simplification) in an executor thread, so the event loop keeps serving the
+# -> other requests meanwhile. call isn't enough for it: with DB_ASYNC, run_sync runs fn on the event loop thread
+async def off_loop(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+# -> same as call for the write endpoints, a transaction that hit a serialization failure or a deadlock is
+# -> rolled back and the whole crud function runs again, nothing of the failed attempt was committed.
+async def call_write(db, fn, *args):
+    for attempt in range(config.DB_WRITE_RETRIES + 1):
+        try:
+            return await call(db, fn, *args)
+        except DBAPIError as e:
+            if attempt == config.DB_WRITE_RETRIES or not database.is_retryable(e):
+                raise
+            if isinstance(db, AsyncSession):
+                await db.rollback()
+            else:
+                await run_in_threadpool(db.rollback)
+            await asyncio.sleep(config.DB_WRITE_RETRY_BACKOFF_MS * 2 ** attempt * random.uniform(0.5, 1.5) / 1000)
+
+
+# -> read-through cache for the GET endpoints below. the serialized body is what gets cached, so a hit skips
+# -> both the database and the serialization, and a client sending back the ETag gets an empty 304.
+# -> tags is a list, or a function of the computed result when the tags depend on it.
+# -> the crud results already hold the final values (ids, Decimals, floats), so they are encoded once with
+# -> orjson and not validated against the route's response_model, that one only documents the shape.
+async def cached_response(request: Request, key: str, tags, compute):
+    body = cache.lookup(key)
+    status = "HIT"
+    if body is None:
+        status = "MISS"
+        version = cache.current_version()
+        result = await compute()
+        body = serialization.dumps(result)
+        cache.store(key, body, tags(result) if callable(tags) else tags, version)
+
+    etag = cache.etag(body)
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "X-Cache": status})
+    return Response(body, media_type="application/json", headers={"ETag": etag, "X-Cache": status})
+
+
+# -> prometheus text format, the per route histograms are only filled while PROFILING is on
+@router.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(profiling.render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/metrics/cache")
+async def cache_metrics():
+    return cache.stats()
+
+
+@router.get("/metrics/pool")
+async def pool_metrics():
+    return database.pool_stats()
 
 
 @router.get("/")
-def test_db(db: Session = Depends(get_db)):
+async def test_db(db: Session = Depends(get_db)):
     try:
-        db.execute(text("SELECT 1"))
+        await call(db, lambda session: session.execute(text("SELECT 1")))
         return {"status": "connected"}
     except Exception as e:
         return {"status": "failed", "error": str(e)}
 
 
 @router.post("/groups", response_model=schemas.GroupResponse)
-def create_group(group: schemas.GroupCreate, db: Session = Depends(get_db)):
-    return crud.create_group(db, group)
+async def create_group(group: schemas.GroupCreate, db: Session = Depends(get_db)):
+    return await call_write(db, crud.create_group, group)
 
 
 @router.post("/groups/{group_id}/members", response_model=schemas.MemberAddResponse)
-def add_members_to_group(group_id: str, request: schemas.MemberAddRequest, db: Session = Depends(get_db)):
-    response = crud.add_members(db, group_id, request)
+async def add_members_to_group(group_id: str, request: schemas.MemberAddRequest, db: Session = Depends(get_db)):
+    response = await call_write(db, crud.add_members, group_id, request)
     if response is None:
         raise HTTPException(status_code=404, detail="Group not found")
     return response
 
 
 @router.get("/groups/{group_id}/members")
-def get_group_members(group_id: str, db: Session = Depends(get_db)):
-    return crud.get_members_in_group(db, group_id)
+async def get_group_members(group_id: str, db: Session = Depends(get_read_db)):
+    return serialization.ORJSONResponse(await call(db, crud.get_members_in_group, group_id))
 
 
 @router.post("/groups/{group_id}/expenses", response_model=schemas.ExpenseResponse)
-def add_expense(group_id: str, request: schemas.ExpenseCreate, db: Session = Depends(get_db)):
-    return crud.create_expense(db, group_id, request)
+async def add_expense(group_id: str, request: schemas.ExpenseCreate, db: Session = Depends(get_db)):
+    return await call_write(db, crud.create_expense, group_id, request)
+
+
+# -> newest first, pass next_cursor back as ?cursor= to get the following page
+@router.get("/groups/{group_id}/expenses", response_model=schemas.ExpenseListResponse)
+async def list_expenses(
+    group_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    paid_by: Optional[UUID] = Query(None, description="group member id of the payer"),
+    member_id: Optional[UUID] = Query(None, description="group member id taking part in the split"),
+    created_from: Optional[datetime] = Query(None, description="inclusive"),
+    created_to: Optional[datetime] = Query(None, description="exclusive"),
+    min_amount: Optional[Decimal] = None,
+    max_amount: Optional[Decimal] = None,
+    include_splits: bool = False,
+    db: Session = Depends(get_read_db)
+):
+    return await call(db, lambda session: crud.list_expenses(
+        session, group_id, cursor, limit, paid_by, member_id,
+        created_from, created_to, min_amount, max_amount, include_splits
+    ))
+
+
+# -> full history of the group (expenses, splits, settlements) as one flat table, streamed batch by batch
+@router.get("/groups/{group_id}/export")
+async def export_group(
+    group_id: str,
+    format: Literal["csv", "ndjson", "parquet"] = Query("csv"),
+    db: Session = Depends(get_read_db)
+):
+    await call(db, export.ensure_group, group_id)
+    return StreamingResponse(
+        export.stream(group_id, format),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="group-{group_id}.{format}"'}
+    )
+
+
+# -> accepts a JSON list, or a streamed NDJSON / CSV body picked by the Content-Type header.
+# -> the body is parsed while it is being received and everything is inserted in one transaction.
+@router.post("/groups/{group_id}/expenses/bulk", response_model=schemas.BulkExpenseResponse)
+async def bulk_add_expenses(group_id: str, request: Request, db: Session = Depends(get_db)):
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+
+    in_greenlet = isinstance(db, AsyncSession)
+
+    if content_type in bulk_import.NDJSON_TYPES:
+        rows = bulk_import.parse_ndjson(bulk_import.iter_lines(bulk_import.iter_request_chunks(request, in_greenlet)))
+    elif content_type in bulk_import.CSV_TYPES:
+        rows = bulk_import.parse_csv(bulk_import.iter_lines(bulk_import.iter_request_chunks(request, in_greenlet)))
+    elif content_type == "application/json":
+        try:
+            rows = bulk_import.parse_json(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type {content_type}")
+
+    # not retried like the other writes, a streamed body can only be read once
+    return await call(db, crud.bulk_create_expenses, group_id, rows)
 
 
 @router.get("/groups/{group_id}/balance", response_model=schemas.BalanceResponse)
-def get_group_balance(group_id: str, db: Session = Depends(get_db)):
-    return crud.get_group_balance(db, group_id)
+async def get_group_balance(
+    group_id: str,
+    request: Request,
+    strategy: Literal["exact", "greedy"] = Query("exact", description="debt simplification strategy"),
+    db: Session = Depends(get_read_db)
+):
+    async def compute():
+        balance = await call(db, crud.read_group_balance, group_id)
+        return crud.group_balance_payload(balance, await off_loop(settlement.simplify, balance["nets"], strategy))
+
+    return await cached_response(request, f"balance:{group_id}:{strategy}", [cache.group_tag(group_id)], compute)
+
+
+# -> the balances of up to BATCH_BALANCE_MAX_GROUPS groups with a fixed number of queries, for dashboards that would
+# -> otherwise call the endpoint above once per group. not cached, the result is encoded once like the cached reads
+@router.post("/groups/balances:batch", response_model=schemas.BatchBalanceResponse)
+async def get_group_balances(
+    request: schemas.BatchBalanceRequest,
+    strategy: Literal["exact", "greedy"] = Query("exact", description="debt simplification strategy"),
+    db: Session = Depends(get_read_db)
+):
+    balances = await call(db, crud.get_group_balances, request.group_ids)
+    transfers = await off_loop(settlement.simplify_many, balances["nets"], strategy, config.BATCH_BALANCE_WORKERS)
+    return serialization.ORJSONResponse(crud.group_balances_payload(balances, transfers))
 
 
 @router.post("/groups/{group_id}/settle", response_model=schemas.SettlementResponse)
-def settle_up(group_id: str, request: schemas.SettlementCreate, db: Session = Depends(get_db)):
-    return crud.record_settlement(db, group_id, request)
+async def settle_up(group_id: str, request: schemas.SettlementCreate, db: Session = Depends(get_db)):
+    return await call_write(db, crud.record_settlement, group_id, request)
 
 
 @router.delete("/groups/{group_id}/expenses/{expense_id}", response_model=dict)
-def delete_expense(group_id: str, expense_id: str, db: Session = Depends(get_db)):
-    return crud.delete_expense(db, group_id, expense_id)
+async def delete_expense(group_id: str, expense_id: str, db: Session = Depends(get_db)):
+    return await call_write(db, crud.delete_expense, group_id, expense_id)
 
 
 @router.get("/members/{user_id}/summary", response_model=schemas.MemberSummaryResponse)
-def get_member_summary(user_id: str, db: Session = Depends(get_db)):
-    result = crud.get_member_summary(db, user_id)
-    if not result:
-        raise HTTPException(status_code=404, detail="Member not found")
-    return result
+async def get_member_summary(user_id: str, request: Request, db: Session = Depends(get_read_db)):
+    async def compute():
+        result = await call(db, crud.get_member_summary, user_id)
+        if not result:
+            raise HTTPException(status_code=404, detail="Member not found")
+        return result
 
-@router.get("/groups/{group_id}/analytics")
-def group_analytics(group_id: str, db: Session = Depends(get_db)):
-    return crud.get_group_analytics(db, group_id)
+    # -> the summary reads every group of the user, so it is dropped by a write to any of them
+    return await cached_response(
+        request,
+        f"summary:{user_id}",
+        lambda result: [cache.user_tag(user_id)] + [cache.group_tag(g["group_id"]) for g in result["groups"]],
+        compute
+    )
+
+# -> one transfer per person the user settles with, netted over the groups, each group simplified like /balance
+@router.get("/members/{user_id}/settle-plan", response_model=schemas.SettlePlanResponse)
+async def get_settle_plan(
+    user_id: str,
+    request: Request,
+    strategy: Literal["exact", "greedy"] = Query("exact", description="debt simplification strategy"),
+    db: Session = Depends(get_read_db)
+):
+    async def compute():
+        plan = await call(db, crud.read_settle_plan, user_id)
+        transfers = await off_loop(settlement.simplify_many, plan["nets"], strategy, config.BATCH_BALANCE_WORKERS)
+        return crud.settle_plan_payload(plan, transfers)
 
+    return await cached_response(
+        request,
+        f"settle_plan:{user_id}:{strategy}",
+        lambda result: [cache.user_tag(user_id)] + [cache.group_tag(g) for g in result["group_ids"]],
+        compute
+    )
+
+@router.get("/groups/{group_id}/analytics")
+async def group_analytics(
+    group_id: str,
+    request: Request,
+    granularity: Literal["day", "week", "month"] = Query("day", description="timeline bucket size"),
+    start_date: Optional[date] = Query(None, description="inclusive"),
+    end_date: Optional[date] = Query(None, description="inclusive"),
+    db: Session = Depends(get_read_db)
+):
+    return await cached_response(
+        request,
+        f"analytics:{group_id}:{granularity}:{start_date}:{end_date}",
+        [cache.group_tag(group_id)],
+        lambda: call(db, crud.get_group_analytics, group_id, granularity, start_date, end_date)
+    )
@@ -1,6 +1,6 @@
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 from uuid import UUID
 from pydantic import BaseModel, EmailStr,Field
 
@@ -68,6 +68,18 @@ class ExpenseCreate(BaseModel):
     split_details: List[SplitDetailInput] # so this is list of people among whom the money will be split
 
 
+class BulkExpenseError(BaseModel):
+    row: int
+    error: str
+
+
+class BulkExpenseResponse(BaseModel):
+    group_id: UUID
+    inserted: int
+    failed: int
+    errors: List[BulkExpenseError]
+
+
 class SplitDetailResponse(BaseModel):
     member_id: UUID
     member_name: str
@@ -82,6 +94,28 @@ class ExpenseResponse(BaseModel):
     split_details: List[SplitDetailResponse]
 
 
+class ExpenseSplitItem(BaseModel):
+    member_id: UUID
+    amount: Optional[Decimal]
+    percentage: Optional[Decimal]
+
+
+class ExpenseListItem(BaseModel):
+    id: UUID
+    description: Optional[str]
+    amount: Decimal
+    paid_by: UUID
+    split_type: str
+    created_at: datetime
+    split_details: Optional[List[ExpenseSplitItem]] = None
+
+
+class ExpenseListResponse(BaseModel):
+    group_id: UUID
+    expenses: List[ExpenseListItem]
+    next_cursor: Optional[str] # pass it back as ?cursor= for the next page, null on the last page
+
+
 class SettlementCreate(BaseModel):
     from_group_member_id: UUID
     to_group_member_id: UUID
@@ -111,6 +145,15 @@ class BalanceResponse(BaseModel):
     member_summaries: List[BalanceSummary]
 
 
+class BatchBalanceRequest(BaseModel):
+    group_ids: List[UUID]
+
+
+class BatchBalanceResponse(BaseModel):
+    balances: Dict[str, BalanceResponse] # keyed by group id
+    not_found: List[UUID]
+
+
 class MemberGroupSummary(BaseModel):
     group_id: UUID
     group_name: str
@@ -124,3 +167,26 @@ class MemberSummaryResponse(BaseModel):
     overall_balance: Decimal
     groups: List[MemberGroupSummary]
 
+
+class SettlePlanGroup(BaseModel):
+    group_id: UUID
+    group_name: str
+    amount: Decimal # what this group adds to the transfer, negative when it offsets it
+    from_member_id: UUID # the settlement to record in the group, it pays abs(amount)
+    to_member_id: UUID
+
+
+class SettlePlanTransfer(BaseModel):
+    from_: dict
+    to: dict
+    amount: Decimal
+    groups: List[SettlePlanGroup]
+
+
+class SettlePlanResponse(BaseModel):
+    user_id: UUID
+    name: str
+    net_balance: Decimal
+    transfers: List[SettlePlanTransfer]
+    group_ids: List[UUID]
+
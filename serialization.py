@@ -0,0 +1,30 @@
+from decimal import Decimal
+from uuid import UUID
+import orjson
+from fastapi.responses import JSONResponse
+
+# -> JSON encoding of the responses built from plain crud results: the cached read endpoints and the member list.
+# -> orjson handles uuids, datetimes, dates and numpy values itself, Decimals are written as strings the way
+# -> pydantic writes them, so the money fields look the same on every route. the routes that return a model
+# -> are left to fastapi, it writes those straight from the model with pydantic, which beats dumping the model
+# -> to python and handing that to orjson.
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+# orjson only takes uuid.UUID itself, asyncpg hands back ids as its own subclass of it
+def _default(value):
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+# this encodes a response value to JSON bytes in one pass, nothing is validated or converted up front
+def dumps(value) -> bytes:
+    return orjson.dumps(value, default=_default, option=OPTIONS)
+
+
+# -> returned by a route itself, so fastapi doesn't run the result through jsonable_encoder first
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,155 @@
+import heapq
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+
+# -> the exact solver is exponential in the number of members with a non-zero balance,
+# -> above this it falls back to the greedy matcher
+EXACT_MAX_MEMBERS = 20
+
+
+# this settles the balances by always matching the biggest debtor with the biggest creditor, O(n log n).
+# balances is {member: cents}, positive means the member gets money back, and it returns [(from, to, cents)]
+def greedy(balances: dict) -> list:
+    debtors = [(cents, key) for key, cents in balances.items() if cents < 0]
+    creditors = [(-cents, key) for key, cents in balances.items() if cents > 0]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    transfers = []
+    while debtors and creditors:
+        debt, debtor = heapq.heappop(debtors)
+        credit, creditor = heapq.heappop(creditors)
+        amount = min(-debt, -credit)
+        transfers.append((debtor, creditor, amount))
+
+        if debt + amount < 0:
+            heapq.heappush(debtors, (debt + amount, debtor))
+        if credit + amount < 0:
+            heapq.heappush(creditors, (credit + amount, creditor))
+
+    return transfers
+
+
+# this finds the biggest number of zero-sum groups the values can be split into.
+# every group of k members settles with k - 1 transfers, so more groups means fewer transfers.
+# dp[mask] is the longest chain of zero-sum subsets ending at mask, computed one popcount layer at a time.
+def _zero_sum_groups(values: list) -> list:
+    n = len(values)
+    masks = np.arange(1 << n, dtype=np.int64)
+    sums = np.zeros(1 << n, dtype=np.int64)
+    popcount = np.zeros(1 << n, dtype=np.int8)
+    for i, value in enumerate(values):
+        has_bit = (masks >> i) & 1
+        sums += has_bit * value
+        popcount += has_bit.astype(np.int8)
+    zero = (sums == 0).astype(np.int8)
+
+    dp = np.zeros(1 << n, dtype=np.int8)
+    for size in range(1, n + 1):
+        layer = masks[popcount == size]
+        best = np.zeros(len(layer), dtype=np.int8)
+        for i in range(n):
+            bit = 1 << i
+            has_bit = (layer & bit) != 0
+            best[has_bit] = np.maximum(best[has_bit], dp[layer[has_bit] ^ bit])
+        dp[layer] = best + zero[layer]
+
+    # walking the chain back from the full set, every zero-sum mask on the way closes a group
+    chain = []
+    mask = (1 << n) - 1
+    while mask:
+        if zero[mask]:
+            chain.append(mask)
+        target = dp[mask] - zero[mask]
+        for i in range(n):
+            bit = 1 << i
+            if mask & bit and dp[mask ^ bit] == target:
+                mask ^= bit
+                break
+
+    # whatever is left outside the biggest zero-sum mask (only when the balances don't net to zero) is one more group
+    full = (1 << n) - 1
+    groups = [outer & ~inner for outer, inner in zip([full] + chain, chain + [0]) if outer & ~inner]
+    return [[i for i in range(n) if group >> i & 1] for group in groups]
+
+
+# this gives the minimum possible number of transfers, by splitting the members into
+# as many independent zero-sum groups as possible and settling each one on its own
+def exact(balances: dict) -> list:
+    open_balances = {key: cents for key, cents in balances.items() if cents != 0}
+
+    # a debtor and a creditor with the exact same amount are always one transfer in an optimal plan
+    transfers = []
+    by_amount = {}
+    for key, cents in open_balances.items():
+        match = by_amount.get(-cents)
+        if match:
+            other = match.pop()
+            transfers.append((key, other, -cents) if cents < 0 else (other, key, cents))
+        else:
+            by_amount.setdefault(cents, []).append(key)
+    remaining = [(key, cents) for cents, keys in by_amount.items() for key in keys]
+
+    if len(remaining) > EXACT_MAX_MEMBERS:
+        return transfers + greedy(dict(remaining))
+
+    if remaining:
+        for group in _zero_sum_groups([cents for _, cents in remaining]):
+            transfers.extend(greedy(dict(remaining[i] for i in group)))
+
+    return transfers
+
+
+STRATEGIES = {
+    "greedy": greedy,
+    "exact": exact,
+}
+
+
+# this is the entry point used by crud, strategy is one of the STRATEGIES keys
+def simplify(balances: dict, strategy: str = "exact") -> list:
+    return STRATEGIES[strategy](balances)
+
+
+# -> worker processes for simplify_many, started on first use and kept for the life of the process.
+# -> spawned rather than forked, the server process has threads and open connections a fork would copy
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _drop_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# this simplifies the balances of many groups, {key: balances} -> {key: transfers}. exact is CPU bound python and
+# numpy, so with more than one worker the groups are spread over the process pool in chunks. greedy costs
+# microseconds per group, less than shipping it to a worker, and always runs here
+def simplify_many(balances_by_group: dict, strategy: str = "exact", workers: int = 1) -> dict:
+    keys = list(balances_by_group)
+    if strategy == "greedy" or workers <= 1 or len(keys) < 2:
+        return {key: simplify(balances_by_group[key], strategy) for key in keys}
+
+    pool = _get_pool(workers)
+    try:
+        chunksize = max(1, len(keys) // (workers * 4))
+        transfers = list(pool.map(STRATEGIES[strategy], [balances_by_group[key] for key in keys], chunksize=chunksize))
+    except BrokenProcessPool:
+        # a worker died (killed, out of memory), the next call starts a fresh pool and this one is worked out here
+        _drop_pool(pool)
+        return {key: simplify(balances_by_group[key], strategy) for key in keys}
+    return dict(zip(keys, transfers))
@@ -0,0 +1,91 @@
+import struct
+from uuid import UUID
+from sqlalchemy import LargeBinary, literal
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.types import Boolean
+import money
+
+# -> compact split storage: an EQUAL or PERCENTAGE split is kept on the expense row itself as its rule
+# -> (expenses.split_rule) and the packed participants (expenses.split_members), 16 bytes of member id each,
+# -> followed by a 2 byte weight in hundredths of a percent for PERCENTAGE. the per-member amounts are worked
+# -> out from those with the same largest remainder math the write used, so they come out identical to the
+# -> rows split_details would have held. EXACT splits can't be derived and keep their split_details rows.
+
+RULES = ("EQUAL", "PERCENTAGE")
+
+_WEIGHT = struct.Struct(">H")
+
+
+def _member_bytes(member_id) -> bytes:
+    return member_id.bytes if isinstance(member_id, UUID) else UUID(str(member_id)).bytes
+
+
+# this packs the participants in split order, weights only for PERCENTAGE
+def pack(member_ids, weights=None) -> bytes:
+    if weights is None:
+        return b"".join(_member_bytes(m) for m in member_ids)
+    return b"".join(_member_bytes(m) + _WEIGHT.pack(w) for m, w in zip(member_ids, weights))
+
+
+# this gives ([member id bytes], [weight]) back from the packed bytes, weights is None for EQUAL
+def unpack(rule: str, packed: bytes) -> tuple:
+    packed = bytes(packed)
+    if rule == "EQUAL":
+        return [packed[i:i + 16] for i in range(0, len(packed), 16)], None
+    stride = 16 + _WEIGHT.size
+    return (
+        [packed[i:i + 16] for i in range(0, len(packed), stride)],
+        [_WEIGHT.unpack_from(packed, i + 16)[0] for i in range(0, len(packed), stride)]
+    )
+
+
+# this derives the cents of every participant as [(member id bytes, cents)], the raw ids keep it cheap
+# for the loops that go over many expenses and only compare ids
+def raw_shares(rule: str, packed: bytes, total: int) -> list:
+    keys, weights = unpack(rule, packed)
+    return list(zip(keys, money.allocate_small(total, weights or [1] * len(keys))))
+
+
+# this derives the split of a compact expense as [(member_id, cents, percentage)], percentage is None for EQUAL
+def shares(rule: str, packed: bytes, total: int) -> list:
+    keys, weights = unpack(rule, packed)
+    cents = money.allocate_small(total, weights or [1] * len(keys))
+    percentages = [money.from_cents(w) for w in weights] if weights else [None] * len(keys)
+    return [(UUID(bytes=key), c, p) for key, c, p in zip(keys, cents, percentages)]
+
+
+# this gives the split of any expense as (member_id, amount, percentage) rows, derived for a compact one
+# and read from the loaded split_details otherwise
+def expense_splits(expense) -> list:
+    if expense.split_rule:
+        return [
+            (member_id, money.from_cents(cents), percentage)
+            for member_id, cents, percentage in shares(expense.split_rule, expense.split_members, money.to_cents(expense.amount))
+        ]
+    return [(s.member_id, s.amount, s.percentage) for s in expense.splits]
+
+
+# -> byte substring test on the packed participants: position() on postgres bytea, instr() on sqlite blobs.
+# -> member ids are random, so a 16 byte match only ever lines up with a whole entry
+class _PackedContains(FunctionElement):
+    type = Boolean()
+    inherit_cache = True
+    name = "packed_contains"
+
+
+@compiles(_PackedContains)
+def _compile_instr(element, compiler, **kw):
+    packed, needle = element.clauses
+    return f"instr({compiler.process(packed, **kw)}, {compiler.process(needle, **kw)}) > 0"
+
+
+@compiles(_PackedContains, "postgresql")
+def _compile_position(element, compiler, **kw):
+    packed, needle = element.clauses
+    return f"position({compiler.process(needle, **kw)} in {compiler.process(packed, **kw)}) > 0"
+
+
+# this is the SQL condition "member takes part in this compact split"
+def has_member(packed_column, member_id):
+    return _PackedContains(packed_column, literal(_member_bytes(member_id), LargeBinary))